@@ -1,17 +1,202 @@
+import io
 import os
+import sys
+import re
+import csv
+import json
+import zlib
+import contextlib
+import itertools
+import threading
+import queue
+import base64
+import hashlib
+import sqlite3
 import datetime
-from flask import Flask, request, jsonify
+from urllib.parse import urlsplit, urlunsplit
+import time
+import click
+from flask import Flask, Response, request, jsonify, g, has_request_context, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import (and_, or_, select, insert, update, literal, func, except_, union_all, inspect, text, event,
+                        table, column, tuple_)
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import aliased
 from dotenv import load_dotenv
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+
+try:
+    from .events import InMemoryBroker, TooManySubscribers
+    from .graph import FriendGraph, mutual, suggest
+except ImportError:
+    from events import InMemoryBroker, TooManySubscribers
+    from graph import FriendGraph, mutual, suggest
 
 load_dotenv()
 
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///:memory:')
+
+def engine_options(url):
+    """Pool settings for persistent databases; in-memory SQLite keeps its single static connection."""
+    if url.startswith('sqlite') and (':memory:' in url or url.rstrip('/') == 'sqlite:'):
+        return {}
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1',
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    }
+
+# Applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -64000)),
+    'temp_store': 'MEMORY',
+}
+
+# Applied on top while a bulk import holds the connection. Losing the last
+# transactions to a crash is fine there: the import is idempotent and re-run.
+SQLITE_BULK_PRAGMAS = {
+    'synchronous': 'OFF',
+    'cache_size': -256000,
+}
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        apply_pragmas(dbapi_connection, SQLITE_PRAGMAS)
+
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///:memory:')
+app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(DATABASE_URL)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
 
+# History pagination
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 50))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', 200))
+
+# New-share push channel. `uvicorn --interface wsgi` serves each response from a
+# 10-thread pool and never notices a client going away, so a stream holds its
+# thread until it ends by itself: streams end after SSE_STREAM_SECONDS (the
+# browser reconnects with Last-Event-ID) and stay well below the pool size.
+broker = InMemoryBroker(max_subscribers=int(os.getenv('SSE_MAX_SUBSCRIBERS', 4)))
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', 15))
+SSE_STREAM_SECONDS = float(os.getenv('SSE_STREAM_SECONDS', 30))
+SSE_RECONNECT_MS = 1000
+SSE_BACKLOG_LIMIT = 100
+
+# Profile fields refreshed from the identity provider on every login
+PROFILE_FIELDS = ('name', 'email', 'avatar_url')
+
+# History export
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_FIELDS = ('id', 'url', 'timestamp', 'sender_id', 'receiver_id', 'sender_name', 'receiver_name')
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+
+# Sections the dashboard endpoint can return
+DASHBOARD_FIELDS = ('user', 'friends', 'history')
+
+# Upper bound on IDs accepted by the batch user lookup
+USERS_MAX_BATCH = int(os.getenv('USERS_MAX_BATCH', 500))
+
+# Upper bound on rows (urls x recipients) a single share request may create
+SHARE_MAX_ROWS = int(os.getenv('SHARE_MAX_ROWS', 5000))
+
+# Bulk import: input fields per kind, users referenced by (provider, provider_id)
+IMPORT_FIELDS = {
+    'users': ('provider', 'provider_id', *PROFILE_FIELDS),
+    'friendships': ('user_provider', 'user_provider_id', 'friend_provider', 'friend_provider_id'),
+    'shares': ('sender_provider', 'sender_provider_id', 'receiver_provider', 'receiver_provider_id', 'url', 'timestamp'),
+}
+IMPORT_BATCH_SIZE = 5000
+
+# Friend graph: adjacency is preloaded at startup for at most this long, the rest on demand
+GRAPH_WARMUP_SECONDS = float(os.getenv('GRAPH_WARMUP_SECONDS', 10))
+SUGGESTIONS_LIMIT = 10
+SUGGESTIONS_MAX_LIMIT = 50
+
+# Request metrics
+REQUEST_SECONDS = Histogram('backend_request_seconds', 'Request latency', ['method', 'route', 'status'])
+SQL_STATEMENTS = Histogram('backend_sql_statements', 'SQL statements per request', ['route'],
+                           buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89))
+SQL_SECONDS = Histogram('backend_sql_seconds', 'Time spent in SQL per request', ['route'])
+# Log any request issuing more statements than this (0 disables); catches N+1 regressions
+SQL_WARN_THRESHOLD = int(os.getenv('SQL_WARN_THRESHOLD', 0))
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_sql_timer(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_sql_timer(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_started' in g:
+        g.sql_count = g.get('sql_count', 0) + 1
+        g.sql_seconds = g.get('sql_seconds', 0.0) + time.perf_counter() - g.pop('sql_started')
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.pop('request_started', time.perf_counter())
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    count, sql_seconds = g.get('sql_count', 0), g.get('sql_seconds', 0.0)
+    REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(elapsed)
+    SQL_STATEMENTS.labels(route).observe(count)
+    SQL_SECONDS.labels(route).observe(sql_seconds)
+    response.headers.add('Server-Timing', f'db;dur={sql_seconds * 1000:.1f};desc="{count} queries"')
+    response.headers.add('Server-Timing', f'app;dur={(elapsed - sql_seconds) * 1000:.1f}')
+    if SQL_WARN_THRESHOLD and count > SQL_WARN_THRESHOLD:
+        app.logger.warning('%s %s ran %d SQL statements in %.1f ms', request.method, request.path, count,
+                           sql_seconds * 1000)
+    return response
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+def normalize_url(url):
+    """Canonicalizes scheme, host, default port and trailing slash."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    userinfo, _, hostport = parts.netloc.rpartition('@')
+    hostport = hostport.lower()
+    default_port = DEFAULT_PORTS.get(scheme)
+    if default_port and hostport.endswith(f':{default_port}'):
+        hostport = hostport[:-len(default_port) - 1]
+    netloc = f'{userinfo}@{hostport}' if userinfo else hostport
+    return urlunsplit((scheme, netloc, parts.path.rstrip('/'), parts.query, parts.fragment))
+
+def stored_url(url):
+    """normalize_url for text already accepted elsewhere; unparseable URLs are kept as they are."""
+    try:
+        return normalize_url(url)
+    except ValueError:
+        return url.strip()
+
+def url_hash(url):
+    return hashlib.sha256(url.encode()).hexdigest()
+
+def dialect_insert(model):
+    """INSERT construct with the ON CONFLICT extensions of the bound dialect."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(model)
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    return sqlite_insert(model)
+
 # Models
 class User(db.Model):
     __tablename__ = 'users'
@@ -21,6 +206,8 @@ class User(db.Model):
     name = db.Column(db.String(255))
     email = db.Column(db.String(255))
     avatar_url = db.Column(db.String(500))
+    # Bumped whenever the user's friends or history change; exposed as an ETag
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     __table_args__ = (db.UniqueConstraint('provider', 'provider_id', name='_provider_user_uc'),)
 
@@ -39,30 +226,788 @@ class Friendship(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     friend_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
 
+class Url(db.Model):
+    """Interned, normalized URL shared by any number of shares."""
+    __tablename__ = 'urls'
+    id = db.Column(db.Integer, primary_key=True)
+    hash = db.Column(db.String(64), unique=True, nullable=False)
+    url = db.Column(db.Text, nullable=False)
+
 class SharedUrl(db.Model):
     __tablename__ = 'shared_urls'
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    url = db.Column(db.Text, nullable=False)
+    url_id = db.Column(db.Integer, db.ForeignKey('urls.id'), nullable=False, index=True)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    
-    sender = db.relationship('User', foreign_keys=[sender_id])
-    receiver = db.relationship('User', foreign_keys=[receiver_id])
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'url': self.url,
-            'timestamp': self.timestamp.isoformat(),
-            'sender_id': self.sender_id,
-            'receiver_id': self.receiver_id,
-            'sender_name': self.sender.name if self.sender else 'Unknown',
-            'receiver_name': self.receiver.name if self.receiver else 'Unknown'
-        }
+    # No relationships or to_dict: reads go through user_timeline, and lazy
+    # sender/receiver/link loads here would be one query per share.
+    __table_args__ = (
+        db.Index('ix_shared_urls_sender_timestamp', 'sender_id', 'timestamp'),
+        db.Index('ix_shared_urls_receiver_timestamp', 'receiver_id', 'timestamp'),
+    )
+
+class TimelineEntry(db.Model):
+    """Per-user read model of shared_urls: one row per participant of a share."""
+    __tablename__ = 'user_timeline'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    share_id = db.Column(db.Integer, db.ForeignKey('shared_urls.id'), nullable=False)
+    direction = db.Column(db.String(8), nullable=False)  # 'sent' or 'received'
+    counterpart_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    counterpart_name = db.Column(db.String(255))
+    url_id = db.Column(db.Integer, db.ForeignKey('urls.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+
+    link = db.relationship('Url', lazy='joined')
+
+    __table_args__ = (
+        db.Index('ix_user_timeline_user_timestamp', 'user_id', 'timestamp', 'share_id'),
+        db.Index('ix_user_timeline_user_url', 'user_id', 'url_id'),
+    )
+
+    def to_dict(self, user_name):
+        return timeline_item(self.user_id, user_name, self.share_id, self.link.url, self.timestamp, self.direction,
+                             self.counterpart_id, self.counterpart_name)
+
+def timeline_item(user_id, user_name, share_id, url, timestamp, direction, counterpart_id, counterpart_name):
+    """API shape of one timeline row, seen from user_id."""
+    me = (user_id, user_name)
+    other = (counterpart_id, counterpart_name or 'Unknown')
+    (sender_id, sender_name), (receiver_id, receiver_name) = (me, other) if direction == 'sent' else (other, me)
+    return {
+        'id': share_id,
+        'url': url,
+        'timestamp': timestamp.isoformat(),
+        'sender_id': sender_id,
+        'receiver_id': receiver_id,
+        'sender_name': sender_name,
+        'receiver_name': receiver_name
+    }
+
+# List endpoints select these columns and build dicts straight from the row
+# tuples, skipping ORM instances and the identity map.
+USER_FIELDS = ('id', 'provider', 'provider_id', *PROFILE_FIELDS)
+USER_COLUMNS = [getattr(User, field) for field in USER_FIELDS]
+
+def timeline_select(user_id):
+    """SELECT of a user's timeline rows in timeline_item argument order (after user_id and name)."""
+    return select(
+        TimelineEntry.share_id, Url.url, TimelineEntry.timestamp, TimelineEntry.direction,
+        TimelineEntry.counterpart_id, TimelineEntry.counterpart_name,
+    ).join(Url, Url.id == TimelineEntry.url_id).where(TimelineEntry.user_id == user_id)
+
+def user_name_of(user_id):
+    row = db.session.execute(select(User.name).where(User.id == user_id)).first()
+    return row.name if row else 'Unknown'
+
+class SchemaVersion(db.Model):
+    """One row per applied schema migration."""
+    __tablename__ = 'schema_version'
+    version = db.Column(db.Integer, primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+# Full-text index over interned URLs: an FTS5 table keyed by url id on SQLite,
+# a GIN-indexed tsvector table on PostgreSQL. Kept outside the model metadata
+# and created/dropped alongside `urls`.
+url_search = table('url_search', column('rowid'), column('url_id'), column('terms'), column('document'))
+SEARCH_TOKEN = re.compile(r'[^\W_]+')
+SEARCH_MAX_TERMS = 8
+SEARCH_DDL = {
+    'sqlite': ["CREATE VIRTUAL TABLE IF NOT EXISTS url_search USING fts5(terms, tokenize='unicode61')"],
+    'postgresql': [
+        'CREATE TABLE IF NOT EXISTS url_search (url_id INTEGER PRIMARY KEY REFERENCES urls (id), document TSVECTOR NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS ix_url_search_document ON url_search USING GIN (document)',
+    ],
+}
+
+def create_search_index(connection):
+    for statement in SEARCH_DDL.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+@event.listens_for(Url.__table__, 'after_create')
+def create_search_table(target, connection, **kw):
+    create_search_index(connection)
+
+@event.listens_for(Url.__table__, 'before_drop')
+def drop_search_table(target, connection, **kw):
+    connection.execute(text('DROP TABLE IF EXISTS url_search'))
+
+def search_terms(url):
+    """Lowercased host, path and query words of a URL, e.g. 'news example com python tips'."""
+    try:
+        parts = urlsplit(url)
+        words = f'{parts.hostname or ""} {parts.path} {parts.query} {parts.fragment}'
+    except ValueError:
+        # Legacy rows may hold text that is not a URL at all
+        words = url
+    return ' '.join(SEARCH_TOKEN.findall(words.lower()))
+
+def index_urls(urls):
+    """Adds {url_id: url} to the full-text index, in the caller's transaction."""
+    rows = [{'id': url_id, 'terms': search_terms(url)} for url_id, url in urls.items()]
+    if not rows:
+        return
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text("INSERT INTO url_search (url_id, document) VALUES (:id, to_tsvector('simple', :terms)) "
+                                "ON CONFLICT DO NOTHING"), rows)
+    else:
+        db.session.execute(text('INSERT INTO url_search (rowid, terms) VALUES (:id, :terms)'), rows)
+
+def rebuild_search_index(batch_size=1000):
+    """Repopulates url_search from urls; returns the number of URLs indexed."""
+    db.session.execute(text('DELETE FROM url_search'))
+    count, last_id = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(Url.id, Url.url).where(Url.id > last_id).order_by(Url.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        index_urls(dict(rows))
+        count += len(rows)
+        last_id = rows[-1][0]
+    db.session.commit()
+    return count
+
+def search_page(user_id, terms, limit, offset=0, user_name=None):
+    """One page of a user's timeline entries whose URL matches every term as a prefix, best first."""
+    stmt = timeline_select(user_id)
+    if db.engine.dialect.name == 'postgresql':
+        tsquery = func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+        stmt = stmt.join(url_search, url_search.c.url_id == TimelineEntry.url_id).where(
+            url_search.c.document.op('@@')(tsquery)
+        )
+        rank = func.ts_rank(url_search.c.document, tsquery).desc()
+    else:
+        stmt = stmt.join(url_search, url_search.c.rowid == TimelineEntry.url_id).where(
+            url_search.c.terms.match(' '.join(f'"{term}"*' for term in terms))
+        )
+        rank = text('bm25(url_search)')
+    rows = db.session.execute(stmt.order_by(
+        rank, TimelineEntry.timestamp.desc(), TimelineEntry.share_id.desc()
+    ).offset(offset).limit(limit + 1)).all()
+
+    if rows and user_name is None:
+        user_name = user_name_of(user_id)
+    next_cursor = str(offset + limit) if len(rows) > limit else None
+    return [timeline_item(user_id, user_name, *row) for row in rows[:limit]], next_cursor
+
+def timeline_rows(share, names):
+    """Builds the timeline rows for a share mapping, given a {user_id: name} map."""
+    rows = [{'user_id': share['sender_id'], 'share_id': share['id'], 'direction': 'sent',
+             'counterpart_id': share['receiver_id'], 'counterpart_name': names.get(share['receiver_id']),
+             'url_id': share['url_id'], 'timestamp': share['timestamp']}]
+    if share['receiver_id'] != share['sender_id']:
+        rows.append({'user_id': share['receiver_id'], 'share_id': share['id'], 'direction': 'received',
+                     'counterpart_id': share['sender_id'], 'counterpart_name': names.get(share['sender_id']),
+                     'url_id': share['url_id'], 'timestamp': share['timestamp']})
+    return rows
+
+TIMELINE_COLUMNS = ['user_id', 'share_id', 'direction', 'counterpart_id', 'counterpart_name', 'url_id', 'timestamp']
+
+def expected_timeline():
+    """SELECT producing the timeline rows implied by shared_urls."""
+    sender = aliased(User)
+    receiver = aliased(User)
+    sent = select(
+        SharedUrl.sender_id, SharedUrl.id, literal('sent'), SharedUrl.receiver_id,
+        receiver.name, SharedUrl.url_id, SharedUrl.timestamp
+    ).outerjoin(receiver, receiver.id == SharedUrl.receiver_id).where(SharedUrl.sender_id.is_not(None))
+    received = select(
+        SharedUrl.receiver_id, SharedUrl.id, literal('received'), SharedUrl.sender_id,
+        sender.name, SharedUrl.url_id, SharedUrl.timestamp
+    ).outerjoin(sender, sender.id == SharedUrl.sender_id).where(
+        SharedUrl.receiver_id.is_not(None), SharedUrl.receiver_id != SharedUrl.sender_id
+    )
+    return union_all(sent, received)
+
+def rebuild_timeline():
+    """Replaces user_timeline with a fresh backfill from shared_urls."""
+    TimelineEntry.query.delete()
+    result = db.session.execute(
+        insert(TimelineEntry).from_select(TIMELINE_COLUMNS, expected_timeline())
+    )
+    db.session.commit()
+    return result.rowcount
+
+def check_timeline():
+    """Counts rows missing from, and stale or orphaned in, user_timeline."""
+    expected = expected_timeline().subquery()
+    actual = select(*[getattr(TimelineEntry, c) for c in TIMELINE_COLUMNS])
+    expected_rows = select(*expected.c)
+
+    def count(stmt):
+        return db.session.scalar(select(func.count()).select_from(stmt.subquery()))
+
+    return {
+        'missing': count(except_(expected_rows, actual)),
+        'unexpected': count(except_(actual, expected_rows)),
+    }
+
+def intern_urls(urls):
+    """Returns {url: id} for already-normalized URLs, inserting the missing ones."""
+    by_hash = {url_hash(url): url for url in urls}
+    ids = dict(db.session.execute(select(Url.hash, Url.id).where(Url.hash.in_(by_hash))).all())
+    missing = [{'hash': h, 'url': url} for h, url in by_hash.items() if h not in ids]
+    if missing:
+        inserted = db.session.execute(
+            dialect_insert(Url).values(missing).on_conflict_do_nothing(index_elements=['hash'])
+            .returning(Url.hash, Url.id, Url.url)
+        ).all()
+        # Only this transaction's inserts are indexed; rows lost to a concurrent insert were indexed by it
+        index_urls({url_id: url for _, url_id, url in inserted})
+        ids.update((h, url_id) for h, url_id, _ in inserted)
+        if len(inserted) < len(missing):
+            ids.update(db.session.execute(
+                select(Url.hash, Url.id).where(Url.hash.in_([m['hash'] for m in missing if m['hash'] not in ids]))
+            ).all())
+    return {url: ids[h] for h, url in by_hash.items()}
+
+def migrate_urls(batch_size=500):
+    """Rewrites a pre-interning shared_urls.url text column into urls + url_id.
+
+    A no-op when the column is already gone. user_timeline is recreated and
+    backfilled since its url column is derived data.
+    """
+    columns = {c['name'] for c in inspect(db.engine).get_columns('shared_urls')}
+    if 'url' not in columns:
+        return 0
+
+    Url.__table__.create(db.engine, checkfirst=True)
+    if 'url_id' not in columns:
+        db.session.execute(text('ALTER TABLE shared_urls ADD COLUMN url_id INTEGER REFERENCES urls(id)'))
+
+    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_shared_urls_legacy_url ON shared_urls (url)'))
+    raw_urls = db.session.scalars(text('SELECT DISTINCT url FROM shared_urls WHERE url_id IS NULL')).all()
+    for start in range(0, len(raw_urls), batch_size):
+        batch = raw_urls[start:start + batch_size]
+        ids = intern_urls({stored_url(url) for url in batch})
+        db.session.execute(
+            text('UPDATE shared_urls SET url_id = :url_id WHERE url = :url'),
+            [{'url_id': ids[stored_url(url)], 'url': url} for url in batch]
+        )
+    db.session.execute(text('DROP INDEX ix_shared_urls_legacy_url'))
+    db.session.execute(text('ALTER TABLE shared_urls DROP COLUMN url'))
+    db.session.commit()
+
+    TimelineEntry.__table__.drop(db.engine, checkfirst=True)
+    for index in SharedUrl.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    TimelineEntry.__table__.create(db.engine)
+    rebuild_timeline()
+    return len(raw_urls)
+
+@app.cli.command('urls-migrate')
+def urls_migrate_command():
+    """Intern the URLs of a database created before the urls table."""
+    click.echo(f"Interned {migrate_urls()} distinct URLs.")
+
+@app.cli.command('timeline-rebuild')
+def timeline_rebuild_command():
+    """Backfill the user_timeline read model from shared_urls."""
+    click.echo(f"Rebuilt user_timeline with {rebuild_timeline()} rows.")
+
+@app.cli.command('search-rebuild')
+def search_rebuild_command():
+    """Rebuild the full-text URL index from urls."""
+    click.echo(f"Indexed {rebuild_search_index()} URLs.")
+
+@app.cli.command('timeline-check')
+def timeline_check_command():
+    """Compare user_timeline against shared_urls."""
+    report = check_timeline()
+    click.echo(f"missing={report['missing']} unexpected={report['unexpected']}")
+    if report['missing'] or report['unexpected']:
+        raise SystemExit(1)
+
+def add_history_indexes():
+    for index in SharedUrl.__table__.indexes:
+        if index.name in ('ix_shared_urls_sender_timestamp', 'ix_shared_urls_receiver_timestamp'):
+            index.create(db.engine, checkfirst=True)
+
+def add_user_versions():
+    if 'version' not in {c['name'] for c in inspect(db.engine).get_columns('users')}:
+        db.session.execute(text('ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0'))
+        db.session.commit()
+
+def add_search_index():
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+    for index in TimelineEntry.__table__.indexes:
+        if index.name == 'ix_user_timeline_user_url':
+            index.create(db.engine, checkfirst=True)
+    rebuild_search_index()
+
+# Version 1 is the original users/friendships/shared_urls schema. Steps inspect
+# the live schema so they are safe on databases that already have part of them.
+MIGRATIONS = [
+    (2, 'composite history indexes on shared_urls', add_history_indexes),
+    (3, 'interned urls table and user_timeline read model', migrate_urls),
+    (4, 'per-user version counter', add_user_versions),
+    (5, 'full-text url search index', add_search_index),
+]
+
+def upgrade_schema():
+    """Brings the database to the latest schema version; returns the versions applied."""
+    if not inspect(db.engine).has_table('users'):
+        db.create_all()
+        db.session.add_all([SchemaVersion(version=v) for v in [1] + [m[0] for m in MIGRATIONS]])
+        db.session.commit()
+        return []
+
+    SchemaVersion.__table__.create(db.engine, checkfirst=True)
+    current = db.session.scalar(select(func.max(SchemaVersion.version))) or 1
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version > current:
+            step()
+            db.session.add(SchemaVersion(version=version))
+            db.session.commit()
+            applied.append(version)
+    return applied
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Apply pending schema migrations."""
+    applied = upgrade_schema()
+    click.echo(f"Applied migrations: {', '.join(map(str, applied))}" if applied else "Schema is up to date.")
+
+graph = FriendGraph()
+
+def warm_graph(budget=GRAPH_WARMUP_SECONDS):
+    """Preloads the friend graph in primary-key order for at most `budget` seconds."""
+    started = time.monotonic()
+    versions = dict(db.session.execute(select(User.id, User.version)).all())
+    edges = db.session.execute(
+        select(Friendship.user_id, Friendship.friend_id)
+        .order_by(Friendship.user_id, Friendship.friend_id)
+        .execution_options(yield_per=10000)
+    )
+    try:
+        loaded = graph.load(edges, versions, deadline=started + budget)
+    finally:
+        edges.close()
+    app.logger.info("Friend graph: loaded %d of %d users in %.2fs",
+                    loaded, len(versions), time.monotonic() - started)
+    return loaded
+
+def warm_graph_in_background():
+    with app.app_context():
+        try:
+            warm_graph()
+        except SQLAlchemyError as e:
+            app.logger.warning("Friend graph warm-up failed: %s", e)
+        finally:
+            db.session.remove()
+
+def prepare():
+    """Per-process setup: schema upgrade and friend-graph warm-up.
+
+    Runs on the first request rather than at import, so CLI commands, tests
+    and worker start-up only pay for the import itself.
+    """
+    # Off in multi-worker deployments, which run `flask db-upgrade` once before starting.
+    # An in-memory database only exists inside this process, so it always needs it.
+    in_memory = not engine_options(DATABASE_URL)
+    if os.getenv('DB_AUTO_UPGRADE', '1') == '1' or in_memory:
+        upgrade_schema()
+    if GRAPH_WARMUP_SECONDS > 0:
+        if in_memory:
+            # Its single connection is shared, so no second thread; it is small anyway
+            warm_graph()
+        else:
+            # Requests are served meanwhile, loading the rows they need on demand
+            threading.Thread(target=warm_graph_in_background, name='graph-warmup', daemon=True).start()
 
-with app.app_context():
-    db.create_all()
+prepared = threading.Event()
+prepare_lock = threading.Lock()
+
+@app.before_request
+def prepare_once():
+    if not prepared.is_set():
+        with prepare_lock:
+            if not prepared.is_set():
+                prepare()
+                prepared.set()
+
+def encode_cursor(timestamp, share_id):
+    """Builds the opaque keyset cursor pointing after (timestamp, share_id)."""
+    raw = f"{timestamp.isoformat()}|{share_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError on malformed input."""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    timestamp, share_id = raw.split('|')
+    return datetime.datetime.fromisoformat(timestamp), int(share_id)
+
+def parse_page_args():
+    """Reads `limit` and `cursor` from the query string."""
+    limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor')
+    return limit, decode_cursor(cursor) if cursor else None
+
+def bump_versions(user_ids):
+    """Increments the version of every given user, in the caller's transaction; returns the new versions."""
+    return dict(db.session.execute(
+        update(User).where(User.id.in_(set(user_ids))).values(version=User.version + 1)
+        .returning(User.id, User.version)
+    ).all())
+
+def upsert_user(provider, provider_id, profile):
+    """Creates or refreshes a user in one INSERT ... ON CONFLICT DO UPDATE ... RETURNING.
+
+    The update only fires when a profile field differs, so a returning user with
+    an unchanged profile costs no write and falls back to a plain lookup. Returns
+    the user and the IDs of friends whose lists show a profile that just changed.
+    """
+    stmt = dialect_insert(User).values(provider=provider, provider_id=provider_id, **profile)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.provider, User.provider_id],
+        set_={**{field: stmt.excluded[field] for field in profile}, 'version': User.version + 1},
+        where=or_(*(getattr(User, field).is_distinct_from(stmt.excluded[field]) for field in profile)),
+    ).returning(User)
+    user = db.session.execute(stmt, execution_options={'populate_existing': True}).scalar_one_or_none()
+    if user is None:
+        return db.session.execute(
+            select(User).where(User.provider == provider, User.provider_id == provider_id)
+        ).scalar_one(), []
+    friends = []
+    if user.version > 0:
+        # An update, not an insert: refresh denormalized names and the ETags that embed this profile
+        renamed = db.session.execute(
+            update(TimelineEntry).where(TimelineEntry.counterpart_id == user.id,
+                                        TimelineEntry.counterpart_name.is_distinct_from(user.name))
+            .values(counterpart_name=user.name).returning(TimelineEntry.user_id)
+        ).scalars().all()
+        friends = db.session.scalars(select(Friendship.user_id).where(Friendship.friend_id == user.id)).all()
+        if renamed or friends:
+            bump_versions([*renamed, *friends])
+    return user, friends
+
+def add_friends(user_id, friend_id):
+    """Inserts both directions of a friendship, tolerating concurrent duplicates.
+
+    Returns both users' new versions if the friendship is new, else an empty dict;
+    pass them to graph.add once committed.
+    """
+    created = db.session.execute(
+        dialect_insert(Friendship).values([
+            {'user_id': user_id, 'friend_id': friend_id},
+            {'user_id': friend_id, 'friend_id': user_id},
+        ]).on_conflict_do_nothing().returning(Friendship.user_id)
+    ).scalars().all()
+    if created:
+        return bump_versions([user_id, friend_id])
+    return {}
+
+def conditional(user_id, build, version=None):
+    """Answers If-None-Match with 304 from the user's version alone, else calls build()."""
+    if version is None:
+        version = db.session.scalar(select(User.version).where(User.id == user_id)) or 0
+    etag = f'{user_id}-{version}'
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = build()
+    resp.set_etag(etag)
+    return resp
+
+def user_versions(user_ids):
+    return dict(db.session.execute(select(User.id, User.version).where(User.id.in_(user_ids))).all())
+
+def friend_rows(versions):
+    """Friend IDs of each user in {user_id: version}, from the graph; stale rows are reloaded in one query."""
+    rows = {user_id: graph.get(user_id, version) for user_id, version in versions.items()}
+    stale = {user_id: [] for user_id, row in rows.items() if row is None}
+    if stale:
+        for user_id, friend_id in db.session.execute(
+            select(Friendship.user_id, Friendship.friend_id).where(Friendship.user_id.in_(stale))
+            .order_by(Friendship.user_id, Friendship.friend_id)
+        ):
+            stale[user_id].append(friend_id)
+        for user_id, friend_ids in stale.items():
+            graph.put(user_id, versions[user_id], friend_ids)
+            rows[user_id] = friend_ids
+    return rows
+
+def user_dicts(user_ids):
+    """Serialized profiles of the given users, in the given order."""
+    if not user_ids:
+        return []
+    users = {row[0]: dict(zip(USER_FIELDS, row))
+             for row in db.session.execute(select(*USER_COLUMNS).where(User.id.in_(user_ids)))}
+    return [users[uid] for uid in user_ids if uid in users]
+
+def friend_list(user_id, version=None):
+    """Serialized friends of a user, ordered by ID."""
+    if version is None:
+        version = user_versions([user_id]).get(user_id)
+        if version is None:
+            return []
+    return user_dicts(list(friend_rows({user_id: version})[user_id]))
+
+def history_page(user_id, limit, cursor=None, user_name=None):
+    """One page of a user's timeline and the cursor for the next one, if any."""
+    stmt = timeline_select(user_id)
+    if cursor:
+        timestamp, share_id = cursor
+        stmt = stmt.where(or_(
+            TimelineEntry.timestamp < timestamp,
+            and_(TimelineEntry.timestamp == timestamp, TimelineEntry.share_id < share_id)
+        ))
+    rows = db.session.execute(stmt.order_by(
+        TimelineEntry.timestamp.desc(), TimelineEntry.share_id.desc()
+    ).limit(limit + 1)).all()
+
+    if rows and user_name is None:
+        user_name = user_name_of(user_id)
+    next_cursor = None
+    if len(rows) > limit:
+        share_id, _, timestamp = rows[limit - 1][:3]
+        next_cursor = encode_cursor(timestamp, share_id)
+    return [timeline_item(user_id, user_name, *row) for row in rows[:limit]], next_cursor
+
+def parse_timestamp(value):
+    """ISO 8601 string to the naive UTC datetime stored in the database; None passes through."""
+    if not value:
+        return None
+    timestamp = datetime.datetime.fromisoformat(value)
+    if timestamp.tzinfo:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def export_batches(user_id, user_name, since=None, until=None):
+    """Yields lists of history items, oldest first, read from a server-side cursor.
+
+    Rows come from user_timeline joined to urls as plain tuples, EXPORT_BATCH_SIZE
+    at a time, so memory stays flat however long the history is.
+    """
+    stmt = timeline_select(user_id)
+    if since:
+        stmt = stmt.where(TimelineEntry.timestamp >= since)
+    if until:
+        stmt = stmt.where(TimelineEntry.timestamp < until)
+    stmt = stmt.order_by(TimelineEntry.timestamp, TimelineEntry.share_id).execution_options(
+        yield_per=EXPORT_BATCH_SIZE
+    )
+    for partition in db.session.execute(stmt).partitions():
+        yield [timeline_item(user_id, user_name, *row) for row in partition]
+
+@contextlib.contextmanager
+def bulk_load_pragmas():
+    """Relaxes SQLite durability on every connection checked out until exit, restoring it on check-in."""
+    if db.engine.dialect.name != 'sqlite':
+        yield
+        return
+
+    def relax(dbapi_connection, connection_record, connection_proxy):
+        apply_pragmas(dbapi_connection, SQLITE_BULK_PRAGMAS)
+
+    def restore(dbapi_connection, connection_record):
+        if dbapi_connection is not None:
+            apply_pragmas(dbapi_connection, {name: SQLITE_PRAGMAS[name] for name in SQLITE_BULK_PRAGMAS})
+
+    event.listen(db.engine, 'checkout', relax)
+    event.listen(db.engine, 'checkin', restore)
+    try:
+        yield
+    finally:
+        event.remove(db.engine, 'checkout', relax)
+        event.remove(db.engine, 'checkin', restore)
+
+def read_records(stream, fmt):
+    """Yields dicts from NDJSON (one object per line) or CSV with a header row."""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+class Importer:
+    """Writes batches of import records, idempotently.
+
+    Users are resolved from an in-memory (provider, provider_id) -> id map,
+    loaded once up front and extended as users are imported. Each load method
+    takes one batch, writes it with multi-row statements in the caller's
+    transaction and returns (written, skipped).
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.names = {}
+        self.remember(db.session.execute(select(User.id, User.provider, User.provider_id, User.name)))
+
+    def remember(self, rows):
+        for user_id, provider, provider_id, name in rows:
+            self.ids[provider, provider_id] = user_id
+            self.names[user_id] = name
+
+    def resolve(self, keys):
+        """Looks up keys missing from the map, e.g. users who signed up during the import."""
+        unknown = [key for key in set(keys) if key not in self.ids]
+        for start in range(0, len(unknown), 1000):
+            self.remember(db.session.execute(
+                select(User.id, User.provider, User.provider_id, User.name)
+                .where(tuple_(User.provider, User.provider_id).in_(unknown[start:start + 1000]))
+            ))
+
+    @staticmethod
+    def key(record, role=None):
+        """(provider, provider_id) of a record, or of its `role` user; None if incomplete."""
+        prefix = f'{role}_' if role else ''
+        provider, provider_id = record.get(f'{prefix}provider'), record.get(f'{prefix}provider_id')
+        if not provider or provider_id in (None, ''):
+            return None
+        return str(provider), str(provider_id)
+
+    def users(self, records):
+        rows = {}
+        for record in records:
+            key = self.key(record)
+            if key:
+                rows[key] = {'provider': key[0], 'provider_id': key[1],
+                             **{field: record.get(field) or None for field in PROFILE_FIELDS}}
+        # Existing users keep their profile; it is refreshed on their next login
+        users = User.__table__
+        created = db.session.execute(
+            dialect_insert(users).on_conflict_do_nothing(index_elements=[users.c.provider, users.c.provider_id])
+            .returning(users.c.id, users.c.provider, users.c.provider_id, users.c.name),
+            [row for key, row in rows.items() if key not in self.ids]
+        ).all() if any(key not in self.ids for key in rows) else []
+        self.remember(created)
+        self.resolve(rows)
+        return len(created), len(records) - len(rows)
+
+    def friendships(self, records):
+        pairs = [(self.key(r, 'user'), self.key(r, 'friend')) for r in records]
+        pairs = [pair for pair in pairs if all(pair)]
+        self.resolve(key for pair in pairs for key in pair)
+        edges = set()
+        for user_key, friend_key in pairs:
+            user_id, friend_id = self.ids.get(user_key), self.ids.get(friend_key)
+            if user_id and friend_id and user_id != friend_id:
+                edges.update({(user_id, friend_id), (friend_id, user_id)})
+        friendships = Friendship.__table__
+        created = db.session.execute(
+            dialect_insert(friendships).on_conflict_do_nothing()
+            .returning(friendships.c.user_id, friendships.c.friend_id),
+            [{'user_id': user_id, 'friend_id': friend_id} for user_id, friend_id in edges]
+        ).all() if edges else []
+        if created:
+            bump_versions(user_id for user_id, _ in created)
+        return len({frozenset(edge) for edge in created}), len(records) - len({frozenset(edge) for edge in edges})
+
+    def shares(self, records):
+        parsed = []
+        for r in records:
+            sender, receiver, url = self.key(r, 'sender'), self.key(r, 'receiver'), r.get('url')
+            try:
+                timestamp = parse_timestamp(r.get('timestamp'))
+                url = stored_url(url) if isinstance(url, str) and url.strip() else None
+            except (TypeError, ValueError):
+                continue
+            if sender and receiver and url and timestamp:
+                parsed.append((sender, receiver, url, timestamp))
+        self.resolve(key for share in parsed for key in share[:2])
+        items = {(self.ids.get(sender), self.ids.get(receiver), url, timestamp)
+                 for sender, receiver, url, timestamp in parsed}
+        items = [item for item in items if item[0] and item[1]]
+        if not items:
+            return 0, len(records)
+
+        url_ids = intern_urls({url for _, _, url, _ in items})
+        keys = {(sender, receiver, url_ids[url], timestamp) for sender, receiver, url, timestamp in items}
+        # A share is identified by sender, receiver, URL and time; skip the ones a previous run wrote
+        existing = set(db.session.execute(
+            select(SharedUrl.sender_id, SharedUrl.receiver_id, SharedUrl.url_id, SharedUrl.timestamp).where(
+                SharedUrl.sender_id.in_({key[0] for key in keys}),
+                SharedUrl.timestamp.between(min(key[3] for key in keys), max(key[3] for key in keys)),
+            )
+        ).all())
+        new = sorted(keys - existing, key=lambda key: key[3])
+        if new:
+            # Core inserts on the tables skip the ORM's per-row bulk bookkeeping
+            shared_urls = SharedUrl.__table__
+            created = db.session.execute(
+                insert(shared_urls).returning(shared_urls.c.id, shared_urls.c.sender_id, shared_urls.c.receiver_id,
+                                              shared_urls.c.url_id, shared_urls.c.timestamp),
+                [{'sender_id': s, 'receiver_id': r, 'url_id': u, 'timestamp': t} for s, r, u, t in new]
+            ).all()
+            shares = [dict(zip(('id', 'sender_id', 'receiver_id', 'url_id', 'timestamp'), row)) for row in created]
+            db.session.execute(insert(TimelineEntry.__table__),
+                               [row for share in shares for row in timeline_rows(share, self.names)])
+            bump_versions({user_id for s, r, _, _ in new for user_id in (s, r)})
+        return len(new), len(records) - len(items)
+
+def run_import(kind, records, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """Imports records of one kind in chunked transactions; returns the totals.
+
+    Every committed batch stays committed if a later one fails, and re-running
+    the same input skips what was already written.
+    """
+    records = iter(records)
+    totals = {'read': 0, 'written': 0, 'skipped': 0, 'seconds': 0.0}
+    started = time.monotonic()
+    with bulk_load_pragmas():
+        importer = Importer()
+        load = getattr(importer, kind)
+        while batch := list(itertools.islice(records, batch_size)):
+            try:
+                written, skipped = load(batch)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            totals['read'] += len(batch)
+            totals['written'] += written
+            totals['skipped'] += skipped
+            totals['seconds'] = time.monotonic() - started
+            if progress:
+                progress(totals)
+    totals['seconds'] = time.monotonic() - started
+    return totals
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(list(IMPORT_FIELDS)))
+@click.argument('source', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), help='Defaults to csv for .csv files, else ndjson.')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True, help='Records per transaction.')
+def import_command(kind, source, fmt, batch_size):
+    """Bulk-load users, friendships or shares from NDJSON or CSV (- for stdin).
+
+    Import users first: friendships and shares reference them by provider and
+    provider ID. Re-running an import skips the records already loaded.
+    """
+    fmt = fmt or ('csv' if source.lower().endswith('.csv') else 'ndjson')
+
+    def progress(totals):
+        rate = totals['read'] / totals['seconds'] if totals['seconds'] else 0
+        click.echo(f"{kind}: {totals['read']:,} read, {totals['written']:,} written, "
+                   f"{totals['skipped']:,} skipped ({rate:,.0f} rows/s)", err=True)
+
+    with contextlib.ExitStack() as stack:
+        stream = sys.stdin if source == '-' else stack.enter_context(open(source, newline='', encoding='utf-8'))
+        totals = run_import(kind, read_records(stream, fmt), batch_size, progress)
+    rate = totals['read'] / totals['seconds'] if totals['seconds'] else 0
+    click.echo(f"Imported {totals['written']:,} new {kind} from {totals['read']:,} records "
+               f"in {totals['seconds']:.1f}s ({rate:,.0f} rows/s); {totals['skipped']:,} skipped.")
+
+@app.route('/health')
+def health():
+    try:
+        db.session.execute(text('SELECT 1'))
+    except SQLAlchemyError:
+        return jsonify({'status': 'unavailable'}), 503
+    return jsonify({'status': 'ok'})
+
+@app.route('/metrics')
+def metrics():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
 @app.route('/api/users/auth', methods=['POST'])
 def auth_user():
@@ -73,20 +1018,33 @@ def auth_user():
     if not provider or not provider_id:
         return jsonify({'error': 'Missing provider info'}), 400
 
-    user = User.query.filter_by(provider=provider, provider_id=provider_id).first()
-    
-    if not user:
-        user = User(
-            provider=provider,
-            provider_id=provider_id,
-            name=data.get('name'),
-            email=data.get('email'),
-            avatar_url=data.get('avatar_url')
-        )
-        db.session.add(user)
-        db.session.commit()
-    
-    return jsonify(user.to_dict())
+    user, refreshed = upsert_user(provider, provider_id, {field: data.get(field) for field in PROFILE_FIELDS})
+
+    invite_friend_id = data.get('invite_friend_id')
+    if invite_friend_id:
+        try:
+            invite_friend_id = int(invite_friend_id)
+        except (TypeError, ValueError):
+            invite_friend_id = None
+    versions = {}
+    if invite_friend_id and invite_friend_id != user.id and db.session.get(User, invite_friend_id):
+        versions = add_friends(user.id, invite_friend_id)
+
+    db.session.commit()
+    if versions:
+        graph.add(user.id, invite_friend_id, versions)
+    # Lets the frontend drop the friend lists it cached with the old profile
+    return jsonify({**user.to_dict(), 'refreshed_friend_ids': refreshed})
+
+@app.route('/api/users', methods=['GET'])
+def get_users():
+    try:
+        ids = [int(uid) for uid in request.args.get('ids', '').split(',') if uid]
+    except ValueError:
+        return jsonify({'error': 'Invalid IDs'}), 400
+    if len(ids) > USERS_MAX_BATCH:
+        return jsonify({'error': f'At most {USERS_MAX_BATCH} IDs per request'}), 400
+    return jsonify(user_dicts(list(dict.fromkeys(ids))))
 
 @app.route('/api/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
@@ -97,17 +1055,206 @@ def get_user(user_id):
 
 @app.route('/api/users/<int:user_id>/friends', methods=['GET'])
 def get_friends(user_id):
-    # Query friendships where user_id matches
-    friend_ids = [f.friend_id for f in Friendship.query.filter_by(user_id=user_id).all()]
-    friends = User.query.filter(User.id.in_(friend_ids)).all()
-    return jsonify([f.to_dict() for f in friends])
+    version = user_versions([user_id]).get(user_id)
+    return conditional(user_id, lambda: jsonify(friend_list(user_id, version)), version)
+
+@app.route('/api/users/<int:user_id>/mutual/<int:other_id>', methods=['GET'])
+def get_mutual_friends(user_id, other_id):
+    versions = user_versions([user_id, other_id])
+    if len(versions) < len({user_id, other_id}):
+        return jsonify({'error': 'User not found'}), 404
+    rows = friend_rows(versions)
+    return jsonify(user_dicts(mutual(rows[user_id], rows[other_id])))
+
+@app.route('/api/users/<int:user_id>/suggestions', methods=['GET'])
+def get_suggestions(user_id):
+    """Friends of friends, ranked by the number of mutual friends."""
+    limit = max(1, min(request.args.get('limit', SUGGESTIONS_LIMIT, type=int), SUGGESTIONS_MAX_LIMIT))
+    version = user_versions([user_id]).get(user_id)
+    if version is None:
+        return jsonify({'error': 'User not found'}), 404
+    row = friend_rows({user_id: version})[user_id]
+    friends = friend_rows(user_versions(list(row))) if row else {}
+    ranked = suggest(user_id, row, friends.values(), limit)
+    profiles = {p['id']: p for p in user_dicts([uid for uid, _ in ranked])}
+    return jsonify([{**profiles[uid], 'mutual_count': count} for uid, count in ranked if uid in profiles])
 
 @app.route('/api/users/<int:user_id>/history', methods=['GET'])
 def get_history(user_id):
-    history = SharedUrl.query.filter(
-        (SharedUrl.sender_id == user_id) | (SharedUrl.receiver_id == user_id)
-    ).order_by(SharedUrl.timestamp.desc()).all()
-    return jsonify([h.to_dict() for h in history])
+    try:
+        limit, cursor = parse_page_args()
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    def build():
+        items, next_cursor = history_page(user_id, limit, cursor)
+        resp = jsonify(items)
+        if next_cursor:
+            resp.headers['X-Next-Cursor'] = next_cursor
+        return resp
+    return conditional(user_id, build)
+
+@app.route('/api/users/<int:user_id>/history/search', methods=['GET'])
+def search_history(user_id):
+    terms = SEARCH_TOKEN.findall(request.args.get('q', '').lower())[:SEARCH_MAX_TERMS]
+    if not terms:
+        return jsonify({'error': 'Missing search terms'}), 400
+    limit = max(1, min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), HISTORY_MAX_PAGE_SIZE))
+    offset = max(0, request.args.get('cursor', 0, type=int))
+
+    def build():
+        items, next_cursor = search_page(user_id, terms, limit, offset)
+        resp = jsonify(items)
+        if next_cursor:
+            resp.headers['X-Next-Cursor'] = next_cursor
+        return resp
+    return conditional(user_id, build)
+
+@app.route('/api/users/<int:user_id>/history/export', methods=['GET'])
+def export_history(user_id):
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        since = parse_timestamp(request.args.get('since'))
+        until = parse_timestamp(request.args.get('until'))
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO 8601 timestamps'}), 400
+    user = db.session.get(User, user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    compress = 'gzip' in request.accept_encodings
+
+    def render(items):
+        if export_format == 'ndjson':
+            return ''.join(json.dumps(item) + '\n' for item in items)
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, EXPORT_FIELDS).writerows(items)
+        return buffer.getvalue()
+
+    def generate():
+        compressor = zlib.compressobj(wbits=31) if compress else None
+        chunks = (render(items) for items in export_batches(user_id, user.name, since, until))
+        if export_format == 'csv':
+            chunks = itertools.chain([','.join(EXPORT_FIELDS) + '\r\n'], chunks)
+        for chunk in chunks:
+            data = chunk.encode()
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+        if compressor:
+            yield compressor.flush()
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="history-{user_id}.{export_format}"',
+        'Vary': 'Accept-Encoding',
+    }
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[export_format], headers=headers)
+
+@app.route('/api/users/<int:user_id>/dashboard', methods=['GET'])
+def get_dashboard(user_id):
+    fields = set(request.args.get('fields', ','.join(DASHBOARD_FIELDS)).split(','))
+    if not fields <= set(DASHBOARD_FIELDS):
+        return jsonify({'error': f"Unknown fields: {', '.join(sorted(fields - set(DASHBOARD_FIELDS)))}"}), 400
+    try:
+        limit, cursor = parse_page_args()
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    user = db.session.get(User, user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    data = {}
+    if 'user' in fields:
+        data['user'] = user.to_dict()
+    if 'friends' in fields:
+        data['friends'] = friend_list(user_id, user.version)
+    if 'history' in fields:
+        data['history'], data['next_cursor'] = history_page(user_id, limit, cursor, user_name=user.name)
+    return jsonify(data)
+
+@app.route('/api/users/<int:user_id>/events', methods=['GET'])
+def get_events(user_id):
+    """Server-Sent Events stream of shares received by the user.
+
+    Event IDs are user_timeline IDs, so a reconnect carrying Last-Event-ID
+    first replays what was missed from the timeline. A fresh connection is sent
+    the user's latest timeline ID up front, so even a stream that ends before any
+    share arrives reconnects with a Last-Event-ID and misses nothing in between.
+    """
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    try:
+        subscription = broker.subscribe(user_id)
+    except TooManySubscribers:
+        return jsonify({'error': 'Too many subscribers'}), 503, {'Retry-After': '5'}
+
+    fresh = last_id is None
+    backlog = []
+    try:
+        if fresh:
+            last_id = db.session.scalar(
+                select(func.max(TimelineEntry.id)).where(TimelineEntry.user_id == user_id)
+            ) or 0
+        else:
+            entries = TimelineEntry.query.filter(
+                TimelineEntry.user_id == user_id, TimelineEntry.direction == 'received', TimelineEntry.id > last_id
+            ).order_by(TimelineEntry.id).limit(SSE_BACKLOG_LIMIT).all()
+            user = db.session.get(User, user_id) if entries else None
+            backlog = [{'id': e.id, 'item': e.to_dict(user.name)} for e in entries]
+    except Exception:
+        broker.unsubscribe(user_id, subscription)
+        raise
+
+    def format_event(event):
+        return f"id: {event['id']}\ndata: {json.dumps(event['item'])}\n\n"
+
+    def stream():
+        deadline = time.monotonic() + SSE_STREAM_SECONDS
+        try:
+            yield f'retry: {SSE_RECONNECT_MS}\n\n'
+            if fresh:
+                # Sets the browser's Last-Event-ID without dispatching an event
+                yield f'id: {last_id}\n\n'
+            seen = last_id
+            for event in backlog:
+                seen = event['id']
+                yield format_event(event)
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    event = subscription.get(timeout=min(SSE_HEARTBEAT, remaining))
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                if event['id'] > seen:
+                    seen = event['id']
+                    yield format_event(event)
+        finally:
+            broker.unsubscribe(user_id, subscription)
+
+    resp = Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # For a response closed before streaming started; unsubscribing twice is harmless
+    resp.call_on_close(lambda: broker.unsubscribe(user_id, subscription))
+    return resp
+
+@app.route('/api/urls/sharers', methods=['GET'])
+def get_url_sharers():
+    url = request.args.get('url')
+    if not url:
+        return jsonify({'error': 'Missing url'}), 400
+    try:
+        url = normalize_url(url)
+    except ValueError:
+        return jsonify({'error': 'Invalid URLs'}), 400
+    sharers = db.session.execute(select(*USER_COLUMNS).where(User.id.in_(
+        select(SharedUrl.sender_id).join(Url, Url.id == SharedUrl.url_id)
+        .where(Url.hash == url_hash(url))
+    )))
+    return jsonify([dict(zip(USER_FIELDS, row)) for row in sharers])
 
 @app.route('/api/friendships', methods=['POST'])
 def add_friendship():
@@ -119,15 +1266,14 @@ def add_friendship():
         return jsonify({'error': 'Missing IDs'}), 400
         
     try:
-        # Check if exists
-        exists = Friendship.query.filter_by(user_id=user_id, friend_id=friend_id).first()
-        if not exists:
-            db.session.add(Friendship(user_id=user_id, friend_id=friend_id))
-            db.session.add(Friendship(user_id=friend_id, friend_id=user_id))
-            db.session.commit()
+        user_id, friend_id = int(user_id), int(friend_id)
+        versions = add_friends(user_id, friend_id)
+        db.session.commit()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
+    if versions:
+        graph.add(user_id, friend_id, versions)
         
     return jsonify({'status': 'ok'}), 201
 
@@ -136,21 +1282,96 @@ def share_url():
     data = request.json
     sender_id = data.get('sender_id')
     friend_ids = data.get('friend_ids')
-    url = data.get('url')
+    urls = data.get('urls') or ([data['url']] if data.get('url') else [])
+    urls = list(dict.fromkeys(urls)) if isinstance(urls, list) else None
     
-    if not sender_id or not friend_ids or not url:
+    if not sender_id or not friend_ids or not urls:
         return jsonify({'error': 'Missing data'}), 400
 
     try:
-        for fid in friend_ids:
-            share = SharedUrl(sender_id=sender_id, receiver_id=fid, url=url)
-            db.session.add(share)
+        sender_id = int(sender_id)
+        friend_ids = list(dict.fromkeys(int(fid) for fid in friend_ids))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid user IDs'}), 400
+    if not all(isinstance(url, str) and url.strip() for url in urls):
+        return jsonify({'error': 'Invalid URLs'}), 400
+    try:
+        urls = list(dict.fromkeys(normalize_url(url) for url in urls))
+    except ValueError:
+        return jsonify({'error': 'Invalid URLs'}), 400
+    if len(urls) * len(friend_ids) > SHARE_MAX_ROWS:
+        return jsonify({'error': f'At most {SHARE_MAX_ROWS} shares per request'}), 413
+
+    # One query resolves the sender's name plus existence and friendship of every recipient.
+    rows = db.session.execute(
+        select(User.id, User.name, Friendship.user_id.is_not(None))
+        .outerjoin(Friendship, and_(Friendship.friend_id == User.id, Friendship.user_id == sender_id))
+        .where(User.id.in_([sender_id, *friend_ids]))
+    ).all()
+    names = {uid: name for uid, name, _ in rows}
+    friends = {uid for uid, _, is_friend in rows if is_friend}
+    if sender_id not in names:
+        return jsonify({'error': 'Sender not found'}), 404
+
+    accepted = [fid for fid in friend_ids if fid in friends]
+    rejected = [
+        {'receiver_id': fid, 'reason': 'not_a_friend' if fid in names else 'unknown_user'}
+        for fid in friend_ids if fid not in friends
+    ]
+    if not accepted:
+        return jsonify({'status': 'rejected', 'shares': [], 'rejected': rejected}), 422
+
+    try:
+        now = datetime.datetime.utcnow()
+        url_ids = intern_urls(urls)
+        urls_by_id = {url_id: url for url, url_id in url_ids.items()}
+        # Returning the (receiver_id, url_id) key instead of asking for parameter order
+        # lets SQLite batch everything into one multi-row INSERT.
+        created = db.session.execute(
+            insert(SharedUrl).returning(SharedUrl.id, SharedUrl.receiver_id, SharedUrl.url_id),
+            [{'sender_id': sender_id, 'receiver_id': fid, 'url_id': url_ids[url], 'timestamp': now}
+             for url in urls for fid in accepted]
+        ).all()
+        shares = [
+            {'id': share_id, 'sender_id': sender_id, 'receiver_id': fid, 'url_id': url_id,
+             'url': urls_by_id[url_id], 'timestamp': now}
+            for share_id, fid, url_id in sorted(created)
+        ]
+        entries = db.session.execute(
+            insert(TimelineEntry).returning(TimelineEntry.id, TimelineEntry.share_id, TimelineEntry.direction),
+            [row for share in shares for row in timeline_rows(share, names)]
+        ).all()
+        versions = bump_versions([sender_id, *accepted])
         db.session.commit()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
+    # Shares leave friendships unchanged, so cached graph rows stay valid at the new versions
+    graph.advance(versions)
+
+    shares_by_id = {share['id']: share for share in shares}
+    for entry_id, share_id, direction in sorted(entries):
+        if direction == 'received':
+            share = shares_by_id[share_id]
+            broker.publish(share['receiver_id'], {'id': entry_id, 'item': {
+                'id': share_id,
+                'url': share['url'],
+                'timestamp': share['timestamp'].isoformat(),
+                'sender_id': sender_id,
+                'receiver_id': share['receiver_id'],
+                'sender_name': names[sender_id],
+                'receiver_name': names[share['receiver_id']]
+            }})
         
-    return jsonify({'status': 'ok'}), 201
+    return jsonify({
+        'status': 'ok',
+        'shares': [
+            {'id': share['id'], 'url': share['url'], 'receiver_id': share['receiver_id'],
+             'receiver_name': names[share['receiver_id']]}
+            for share in shares
+        ],
+        'rejected': rejected
+    }), 201
 
 if __name__ == '__main__':
     host = os.getenv('HOST', '0.0.0.0')
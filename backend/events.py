@@ -0,0 +1,67 @@
+"""Pub/sub of new-share events for the Server-Sent Events stream."""
+import queue
+import threading
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Broker:
+    """Fan-out interface used by share_url and the events endpoint.
+
+    InMemoryBroker only reaches subscribers of the same process; a
+    replica-spanning implementation (e.g. Redis pub/sub) provides the same
+    three methods and is swapped in for the module-level `broker` in app.py.
+    """
+
+    def subscribe(self, user_id):
+        """Returns a queue.Queue receiving the user's events. May raise TooManySubscribers."""
+        raise NotImplementedError
+
+    def unsubscribe(self, user_id, subscription):
+        raise NotImplementedError
+
+    def publish(self, user_id, event):
+        raise NotImplementedError
+
+
+class InMemoryBroker(Broker):
+    def __init__(self, max_subscribers=100, queue_size=100):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers()
+            subscription = queue.Queue(maxsize=self.queue_size)
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+            self._count += 1
+            return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(user_id, set())
+            if subscription in subscriptions:
+                subscriptions.discard(subscription)
+                self._count -= 1
+            if not subscriptions:
+                self._subscribers.pop(user_id, None)
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # A stalled client misses live events; it catches up from the
+                # timeline on reconnect via Last-Event-ID.
+                pass
+
+    def __len__(self):
+        return self._count
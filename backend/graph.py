@@ -0,0 +1,106 @@
+"""In-process adjacency index of the friendships table."""
+import bisect
+import heapq
+import itertools
+import operator
+import threading
+import time
+from array import array
+from collections import Counter
+
+
+class FriendGraph:
+    """Sorted friend-ID arrays per user, each stamped with the user version it reflects.
+
+    Every friendship change bumps both users' versions, so a row whose stamp
+    equals the user's current version in the database is up to date; `get`
+    returns None for anything missing or stale and the caller reloads it. Rows
+    are replaced rather than mutated, so readers never need the lock.
+    """
+
+    def __init__(self):
+        self._rows = {}
+        self._stamps = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._stamps.clear()
+
+    def get(self, user_id, version):
+        if self._stamps.get(user_id) == version:
+            return self._rows.get(user_id)
+        return None
+
+    def put(self, user_id, version, friend_ids):
+        """Stores a row read from the database at `version` unless a newer one is already held."""
+        row = array('i', friend_ids)
+        with self._lock:
+            if self._stamps.get(user_id, -1) <= version:
+                self._rows[user_id] = row
+                self._stamps[user_id] = version
+
+    def add(self, user_id, friend_id, versions):
+        """Applies a committed friendship; `versions` are both users' versions after it.
+
+        A row is patched in place only if it was current right before the change,
+        otherwise it is dropped and reloaded on next use.
+        """
+        with self._lock:
+            for a, b in ((user_id, friend_id), (friend_id, user_id)):
+                row = self._rows.get(a)
+                if row is not None and self._stamps[a] == versions[a] - 1:
+                    position = bisect.bisect_left(row, b)
+                    if position == len(row) or row[position] != b:
+                        row = row[:position] + array('i', [b]) + row[position:]
+                    self._rows[a] = row
+                    self._stamps[a] = versions[a]
+                else:
+                    self._rows.pop(a, None)
+                    self._stamps.pop(a, None)
+
+    def advance(self, versions):
+        """Re-stamps current rows after a version bump that did not change friendships."""
+        with self._lock:
+            for user_id, version in versions.items():
+                if self._stamps.get(user_id) == version - 1:
+                    self._stamps[user_id] = version
+
+    def load(self, edges, versions, deadline=None):
+        """Bulk-loads (user_id, friend_id) pairs sorted by user, then friend.
+
+        Stops at `deadline` (a time.monotonic() value) after the user in progress;
+        users not reached are loaded on demand. Returns the number of users loaded.
+        """
+        loaded = 0
+        for user_id, group in itertools.groupby(edges, key=operator.itemgetter(0)):
+            if user_id in versions:
+                self.put(user_id, versions[user_id], [friend_id for _, friend_id in group])
+                loaded += 1
+            if deadline is not None and time.monotonic() > deadline:
+                break
+        return loaded
+
+
+def mutual(row, other_row):
+    """Sorted IDs present in both friend rows."""
+    if len(row) > len(other_row):
+        row, other_row = other_row, row
+    return sorted(set(row).intersection(other_row))
+
+
+def suggest(user_id, row, friend_rows, limit):
+    """Friends of friends who are not yet friends, as (user_id, mutual_count) pairs.
+
+    Ranked by the number of mutual friends, then by ID.
+    """
+    exclude = set(row)
+    exclude.add(user_id)
+    counts = Counter()
+    for friend_row in friend_rows:
+        counts.update(candidate for candidate in friend_row if candidate not in exclude)
+    return heapq.nsmallest(limit, counts.items(), key=lambda item: (-item[1], item[0]))
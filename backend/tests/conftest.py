@@ -1,10 +1,13 @@
 import pytest
-from backend.app import app, db
+from backend.app import app, db, graph, prepared
 
 @pytest.fixture
 def client():
     app.config['TESTING'] = True
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    graph.clear()
+    # The fixture owns the schema; skip the app's first-request setup
+    prepared.set()
     
     with app.test_client() as client:
         with app.app_context():
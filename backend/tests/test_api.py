@@ -1,5 +1,12 @@
 import pytest
-from backend.app import db, User, Friendship
+import gzip
+import json
+import datetime
+import backend.app as app_module
+from sqlalchemy import text
+from backend.app import (db, User, Friendship, SharedUrl, TimelineEntry, Url, rebuild_timeline, check_timeline,
+                         intern_urls, migrate_urls, rebuild_search_index, graph, warm_graph, bump_versions,
+                         friend_list, history_page, search_page)
 
 def test_friendship_creation(client):
     """Test that creating a friendship updates the database bi-directionally."""
@@ -29,6 +36,7 @@ def test_share_url(client):
     u2 = User(provider='test', provider_id='2', name='Receiver', email='r@test.com')
     db.session.add_all([u1, u2])
     db.session.commit()
+    client.post('/api/friendships', json={'user_id': u1.id, 'friend_id': u2.id})
     
     payload = {
         'sender_id': u1.id,
@@ -45,3 +53,430 @@ def test_share_url(client):
     assert len(data) == 1
     assert data[0]['url'] == 'http://example.com'
     assert data[0]['sender_name'] == 'Sender'
+
+def test_auth_upserts_profile_and_accepts_invite(client):
+    """Test that login refreshes changed profiles atomically and can create the invite friendship."""
+    inviter = User(provider='test', provider_id='1', name='Inviter')
+    db.session.add(inviter)
+    db.session.commit()
+    payload = {'provider': 'google', 'provider_id': 'abc', 'name': 'Old Name', 'email': 'a@test.com'}
+
+    created = client.post('/api/users/auth', json={**payload, 'invite_friend_id': inviter.id}).json
+    assert client.post('/api/users/auth', json=payload).json == created
+    assert Friendship.query.filter_by(user_id=created['id'], friend_id=inviter.id).count() == 1
+    client.post('/api/shares', json={'sender_id': created['id'], 'friend_ids': [inviter.id], 'url': 'http://a.example'})
+    etag = client.get(f'/api/users/{inviter.id}/history').headers['ETag']
+
+    renamed = client.post('/api/users/auth', json={**payload, 'name': 'New Name'}).json
+    assert renamed['id'] == created['id'] and renamed['name'] == 'New Name'
+    assert created['refreshed_friend_ids'] == [] and renamed['refreshed_friend_ids'] == [inviter.id]
+    history = client.get(f'/api/users/{inviter.id}/history')
+    assert history.headers['ETag'] != etag
+    assert history.json[0]['sender_name'] == 'New Name'
+    assert User.query.count() == 2
+
+def test_history_pagination(client):
+    """Test that history is served in keyset pages following the cursor."""
+    u1 = User(provider='test', provider_id='1', name='Sender', email='s@test.com')
+    u2 = User(provider='test', provider_id='2', name='Receiver', email='r@test.com')
+    db.session.add_all([u1, u2])
+    db.session.commit()
+
+    base = datetime.datetime(2025, 1, 1)
+    url_ids = intern_urls([f'http://example.com/{i}' for i in range(5)])
+    for i in range(5):
+        db.session.add(SharedUrl(sender_id=u1.id, receiver_id=u2.id, url_id=url_ids[f'http://example.com/{i}'],
+                                 timestamp=base + datetime.timedelta(minutes=i)))
+    db.session.commit()
+    assert rebuild_timeline() == 10
+
+    seen = []
+    cursor = None
+    while True:
+        resp = client.get(f'/api/users/{u1.id}/history', query_string={'limit': 2, 'cursor': cursor} if cursor else {'limit': 2})
+        assert resp.status_code == 200
+        assert len(resp.json) <= 2
+        seen += [item['url'] for item in resp.json]
+        cursor = resp.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+
+    assert seen == [f'http://example.com/{i}' for i in reversed(range(5))]
+    assert client.get(f'/api/users/{u1.id}/history?cursor=bogus').status_code == 400
+
+def test_timeline_consistency(client):
+    """Test that shares keep the timeline read model consistent with shared_urls."""
+    u1 = User(provider='test', provider_id='1', name='Sender', email='s@test.com')
+    u2 = User(provider='test', provider_id='2', name='Receiver', email='r@test.com')
+    db.session.add_all([u1, u2])
+    db.session.commit()
+    client.post('/api/friendships', json={'user_id': u1.id, 'friend_id': u2.id})
+
+    client.post('/api/shares', json={'sender_id': u1.id, 'friend_ids': [u2.id], 'url': 'http://example.com'})
+    assert check_timeline() == {'missing': 0, 'unexpected': 0}
+
+    sent = client.get(f'/api/users/{u1.id}/history').json
+    assert sent[0]['receiver_name'] == 'Receiver'
+
+    TimelineEntry.query.filter_by(user_id=u2.id).delete()
+    db.session.commit()
+    assert check_timeline() == {'missing': 1, 'unexpected': 0}
+
+    rebuild_timeline()
+    assert check_timeline() == {'missing': 0, 'unexpected': 0}
+
+def test_bulk_share_partial_rejection(client):
+    """Test that a batch share creates rows for friends and reports every other recipient."""
+    sender = User(provider='test', provider_id='1', name='Sender')
+    friend = User(provider='test', provider_id='2', name='Friend')
+    stranger = User(provider='test', provider_id='3', name='Stranger')
+    db.session.add_all([sender, friend, stranger])
+    db.session.commit()
+    client.post('/api/friendships', json={'user_id': sender.id, 'friend_id': friend.id})
+
+    resp = client.post('/api/shares', json={
+        'sender_id': sender.id,
+        'friend_ids': [friend.id, stranger.id, 999],
+        'urls': ['http://a.example', 'http://b.example']
+    })
+    assert resp.status_code == 201
+    assert {s['receiver_name'] for s in resp.json['shares']} == {'Friend'}
+    assert [(s['url'], s['receiver_id']) for s in resp.json['shares']] == [
+        ('http://a.example', friend.id), ('http://b.example', friend.id)
+    ]
+    assert resp.json['rejected'] == [
+        {'receiver_id': stranger.id, 'reason': 'not_a_friend'},
+        {'receiver_id': 999, 'reason': 'unknown_user'}
+    ]
+    assert SharedUrl.query.count() == 2
+
+    resp = client.post('/api/shares', json={'sender_id': sender.id, 'friend_ids': [stranger.id], 'url': 'http://c.example'})
+    assert resp.status_code == 422
+    assert SharedUrl.query.count() == 2
+
+def test_urls_are_interned(client):
+    """Test that equivalent URLs shared to several friends are stored once."""
+    sender = User(provider='test', provider_id='1', name='Sender')
+    friends = [User(provider='test', provider_id=str(i), name=f'Friend {i}') for i in range(2, 5)]
+    db.session.add_all([sender, *friends])
+    db.session.commit()
+    for friend in friends:
+        client.post('/api/friendships', json={'user_id': sender.id, 'friend_id': friend.id})
+
+    client.post('/api/shares', json={'sender_id': sender.id, 'friend_ids': [f.id for f in friends],
+                                     'urls': ['HTTP://Example.com:80/page/', 'http://example.com/page']})
+    assert SharedUrl.query.count() == 3
+    assert [u.url for u in Url.query.all()] == ['http://example.com/page']
+
+    sharers = client.get('/api/urls/sharers', query_string={'url': 'http://EXAMPLE.com/page/'}).json
+    assert [s['name'] for s in sharers] == ['Sender']
+
+def test_migrate_urls(client):
+    """Test that a legacy shared_urls.url column is rewritten into interned urls."""
+    u1 = User(provider='test', provider_id='1', name='Sender')
+    u2 = User(provider='test', provider_id='2', name='Receiver')
+    db.session.add_all([u1, u2])
+    db.session.commit()
+    db.session.execute(text('DROP TABLE user_timeline'))
+    db.session.execute(text('DROP TABLE shared_urls'))
+    db.session.execute(text(
+        'CREATE TABLE shared_urls (id INTEGER PRIMARY KEY, sender_id INTEGER, receiver_id INTEGER, '
+        'url TEXT NOT NULL, timestamp DATETIME)'
+    ))
+    db.session.execute(text(
+        "INSERT INTO shared_urls (sender_id, receiver_id, url, timestamp) VALUES "
+        "(:s, :r, 'http://Example.com/', '2025-01-01 00:00:00'), "
+        "(:s, :r, 'http://example.com', '2025-01-02 00:00:00')"
+    ), {'s': u1.id, 'r': u2.id})
+    db.session.commit()
+
+    assert migrate_urls() == 2
+    assert migrate_urls() == 0
+    assert Url.query.count() == 1
+    history = client.get(f'/api/users/{u2.id}/history').json
+    assert [h['url'] for h in history] == ['http://example.com', 'http://example.com']
+    assert check_timeline() == {'missing': 0, 'unexpected': 0}
+
+def test_malformed_urls_survive_migration_and_are_rejected(client):
+    """Test that an unparseable legacy URL is kept as-is by the migration and refused by the API."""
+    u1 = User(provider='test', provider_id='1', name='Sender')
+    u2 = User(provider='test', provider_id='2', name='Receiver')
+    db.session.add_all([u1, u2])
+    db.session.commit()
+    db.session.execute(text('DROP TABLE user_timeline'))
+    db.session.execute(text('DROP TABLE shared_urls'))
+    db.session.execute(text(
+        'CREATE TABLE shared_urls (id INTEGER PRIMARY KEY, sender_id INTEGER, receiver_id INTEGER, '
+        'url TEXT NOT NULL, timestamp DATETIME)'
+    ))
+    db.session.execute(text(
+        "INSERT INTO shared_urls (sender_id, receiver_id, url, timestamp) "
+        "VALUES (:s, :r, ' http://[broken ', '2025-01-01 00:00:00')"
+    ), {'s': u1.id, 'r': u2.id})
+    db.session.commit()
+
+    migrate_urls()
+    assert [h['url'] for h in client.get(f'/api/users/{u2.id}/history').json] == ['http://[broken']
+
+    client.post('/api/friendships', json={'user_id': u1.id, 'friend_id': u2.id})
+    resp = client.post('/api/shares', json={'sender_id': u1.id, 'friend_ids': [u2.id], 'url': 'http://[broken'})
+    assert resp.status_code == 400 and resp.json == {'error': 'Invalid URLs'}
+    assert client.get('/api/urls/sharers?url=http://[broken').status_code == 400
+
+def test_history_search(client):
+    """Test prefix full-text search over a user's history, scoped to that user and paginated."""
+    u1 = User(provider='test', provider_id='1', name='Sender')
+    u2 = User(provider='test', provider_id='2', name='Receiver')
+    u3 = User(provider='test', provider_id='3', name='Outsider')
+    db.session.add_all([u1, u2, u3])
+    db.session.commit()
+    client.post('/api/friendships', json={'user_id': u1.id, 'friend_id': u2.id})
+    client.post('/api/friendships', json={'user_id': u3.id, 'friend_id': u2.id})
+    client.post('/api/shares', json={'sender_id': u1.id, 'friend_ids': [u2.id], 'urls': [
+        'https://news.example.com/python/tips-and-tricks', 'https://blog.example.org/python-packaging',
+        'https://recipes.example.net/pasta',
+    ]})
+    client.post('/api/shares', json={'sender_id': u3.id, 'friend_ids': [u2.id],
+                                     'url': 'https://python.example/secret'})
+
+    resp = client.get(f'/api/users/{u1.id}/history/search?q=pyth&limit=1')
+    assert resp.status_code == 200 and len(resp.json) == 1
+    second = client.get(f'/api/users/{u1.id}/history/search?q=pyth&limit=1&cursor={resp.headers["X-Next-Cursor"]}')
+    assert 'X-Next-Cursor' not in second.headers
+    found = {item['url'] for item in resp.json + second.json}
+    assert found == {'https://news.example.com/python/tips-and-tricks', 'https://blog.example.org/python-packaging'}
+
+    resp = client.get(f'/api/users/{u1.id}/history/search?q=Python%20TIPS')
+    assert [item['url'] for item in resp.json] == ['https://news.example.com/python/tips-and-tricks']
+    assert client.get(f'/api/users/{u1.id}/history/search?q=secret').json == []
+    assert client.get(f'/api/users/{u1.id}/history/search?q=%20').status_code == 400
+
+    assert rebuild_search_index() == 4
+    assert len(client.get(f'/api/users/{u2.id}/history/search?q=example').json) == 4
+
+def test_history_export_streams_ndjson_csv_and_gzip(client, monkeypatch):
+    """Test that export streams every item in batches, filters by time and compresses on request."""
+    u1 = User(provider='test', provider_id='1', name='Sender')
+    u2 = User(provider='test', provider_id='2', name='Receiver')
+    db.session.add_all([u1, u2])
+    db.session.commit()
+    client.post('/api/friendships', json={'user_id': u1.id, 'friend_id': u2.id})
+    client.post('/api/shares', json={'sender_id': u1.id, 'friend_ids': [u2.id],
+                                     'urls': [f'http://example.com/{i}' for i in range(5)]})
+    monkeypatch.setattr(app_module, 'EXPORT_BATCH_SIZE', 2)
+
+    resp = client.get(f'/api/users/{u2.id}/history/export')
+    assert resp.is_streamed and resp.mimetype == 'application/x-ndjson'
+    items = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert items == client.get(f'/api/users/{u2.id}/history').json[::-1]
+
+    resp = client.get(f'/api/users/{u2.id}/history/export?format=csv', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    rows = gzip.decompress(resp.data).decode().splitlines()
+    assert rows[0] == 'id,url,timestamp,sender_id,receiver_id,sender_name,receiver_name'
+    assert len(rows) == 6 and rows[1].endswith(',Sender,Receiver')
+
+    future = (datetime.datetime.utcnow() + datetime.timedelta(days=1)).isoformat()
+    assert client.get(f'/api/users/{u2.id}/history/export?since={future}').data == b''
+    assert client.get(f'/api/users/{u2.id}/history/export?until=yesterday').status_code == 400
+    assert client.get(f'/api/users/{u2.id}/history/export?format=xml').status_code == 400
+
+def test_bulk_import_is_idempotent(client, tmp_path):
+    """Test that the import command loads users, friendships and shares and skips them on re-run."""
+    users = tmp_path / 'users.ndjson'
+    users.write_text('\n'.join(json.dumps({'provider': 'old', 'provider_id': i, 'name': f'User {i}'})
+                               for i in range(3)) + '\n{"provider": "old"}\n')
+    friendships = tmp_path / 'friendships.csv'
+    friendships.write_text('user_provider,user_provider_id,friend_provider,friend_provider_id\n'
+                           'old,0,old,1\nold,1,old,0\nold,0,old,2\nold,0,old,404\n')
+    shares = tmp_path / 'shares.ndjson'
+    shares.write_text('\n'.join(json.dumps({
+        'sender_provider': 'old', 'sender_provider_id': '0', 'receiver_provider': 'old',
+        'receiver_provider_id': str(receiver), 'url': url, 'timestamp': '2024-01-01T10:00:00+02:00',
+    }) for receiver, url in [(1, 'HTTP://Example.com/'), (2, 'http://example.com/python')]))
+
+    runner = app_module.app.test_cli_runner()
+    for _ in range(2):
+        results = [runner.invoke(args=['import', kind, str(path), '--batch-size', '2'])
+                   for kind, path in [('users', users), ('friendships', friendships), ('shares', shares)]]
+        assert all(r.exit_code == 0 for r in results), [r.output for r in results]
+
+    assert 'Imported 0 new shares from 2 records' in results[2].output
+    assert User.query.count() == 3
+    assert Friendship.query.count() == 4
+    assert SharedUrl.query.count() == 2
+    assert check_timeline() == {'missing': 0, 'unexpected': 0}
+    sender = User.query.filter_by(provider_id='0').one()
+    history = client.get(f'/api/users/{sender.id}/history').json
+    assert {(h['url'], h['timestamp']) for h in history} == {
+        ('http://example.com', '2024-01-01T08:00:00'), ('http://example.com/python', '2024-01-01T08:00:00')}
+    search = client.get(f'/api/users/{sender.id}/history/search?q=python').json
+    assert [h['url'] for h in search] == ['http://example.com/python']
+
+def test_dashboard(client):
+    """Test that the dashboard returns the requested sections in one response."""
+    u1 = User(provider='test', provider_id='1', name='Sender')
+    u2 = User(provider='test', provider_id='2', name='Receiver')
+    db.session.add_all([u1, u2])
+    db.session.commit()
+    client.post('/api/friendships', json={'user_id': u1.id, 'friend_id': u2.id})
+    client.post('/api/shares', json={'sender_id': u1.id, 'friend_ids': [u2.id], 'url': 'http://example.com'})
+
+    data = client.get(f'/api/users/{u1.id}/dashboard').json
+    assert data['user']['name'] == 'Sender'
+    assert [f['name'] for f in data['friends']] == ['Receiver']
+    assert [h['receiver_name'] for h in data['history']] == ['Receiver']
+    assert data['next_cursor'] is None
+
+    assert set(client.get(f'/api/users/{u1.id}/dashboard?fields=friends').json) == {'friends'}
+    assert client.get(f'/api/users/{u1.id}/dashboard?fields=bogus').status_code == 400
+    assert client.get('/api/users/999/dashboard').status_code == 404
+
+def test_friend_graph_mutual_and_suggestions(client):
+    """Test mutual friends and friend-of-friend suggestions served from the adjacency index."""
+    users = [User(provider='test', provider_id=str(i), name=f'User {i}') for i in range(5)]
+    db.session.add_all(users)
+    db.session.commit()
+    a, b, c, d, e = [u.id for u in users]
+    for x, y in [(a, b), (a, c), (b, d), (c, d), (c, e)]:
+        client.post('/api/friendships', json={'user_id': x, 'friend_id': y})
+
+    assert [f['id'] for f in client.get(f'/api/users/{a}/mutual/{d}').json] == [b, c]
+    suggestions = client.get(f'/api/users/{a}/suggestions').json
+    assert [(s['id'], s['mutual_count']) for s in suggestions] == [(d, 2), (e, 1)]
+    assert len(client.get(f'/api/users/{a}/suggestions?limit=1').json) == 1
+    assert client.get(f'/api/users/{a}/mutual/999').status_code == 404
+
+    # A fresh process warms up from the table; a write that bypassed it is caught by the version check
+    graph.clear()
+    assert warm_graph() == 5
+    db.session.add_all([Friendship(user_id=a, friend_id=e), Friendship(user_id=e, friend_id=a)])
+    bump_versions([a, e])
+    db.session.commit()
+    assert [f['id'] for f in client.get(f'/api/users/{a}/friends').json] == [b, c, e]
+    assert [s['id'] for s in client.get(f'/api/users/{a}/suggestions').json] == [d]
+
+def test_list_queries_skip_orm_hydration(client):
+    """Test that friends, history and search pages are built from plain rows."""
+    u1 = User(provider='test', provider_id='1', name='Sender')
+    u2 = User(provider='test', provider_id='2', name='Receiver')
+    db.session.add_all([u1, u2])
+    db.session.commit()
+    client.post('/api/friendships', json={'user_id': u1.id, 'friend_id': u2.id})
+    client.post('/api/shares', json={'sender_id': u1.id, 'friend_ids': [u2.id], 'url': 'http://example.com/a'})
+    u1_id, u2_id = u1.id, u2.id
+    db.session.expunge_all()
+
+    assert [f['name'] for f in friend_list(u1_id)] == ['Receiver']
+    items, _ = history_page(u2_id, 10)
+    assert [(h['sender_name'], h['receiver_name']) for h in items] == [('Sender', 'Receiver')]
+    assert search_page(u2_id, ['example'], 10)[0] == items
+    assert len(db.session.identity_map) == 0
+
+def test_batch_user_lookup(client):
+    """Test that several users are fetched by ID in one request, in request order."""
+    users = [User(provider='test', provider_id=str(i), name=f'User {i}') for i in range(3)]
+    db.session.add_all(users)
+    db.session.commit()
+
+    ids = f'{users[2].id},{users[0].id},999'
+    assert [u['name'] for u in client.get(f'/api/users?ids={ids}').json] == ['User 2', 'User 0']
+    assert client.get('/api/users?ids=a,b').status_code == 400
+
+def test_history_conditional_get(client):
+    """Test that history answers 304 until a share bumps the user's version."""
+    u1 = User(provider='test', provider_id='1', name='Sender')
+    u2 = User(provider='test', provider_id='2', name='Receiver')
+    db.session.add_all([u1, u2])
+    db.session.commit()
+    client.post('/api/friendships', json={'user_id': u1.id, 'friend_id': u2.id})
+
+    first = client.get(f'/api/users/{u2.id}/history')
+    etag = first.headers['ETag']
+    assert client.get(f'/api/users/{u2.id}/history', headers={'If-None-Match': etag}).status_code == 304
+    friends_etag = client.get(f'/api/users/{u2.id}/friends').headers['ETag']
+    assert client.get(f'/api/users/{u2.id}/friends', headers={'If-None-Match': friends_etag}).status_code == 304
+
+    client.post('/api/shares', json={'sender_id': u1.id, 'friend_ids': [u2.id], 'url': 'http://example.com'})
+    resp = client.get(f'/api/users/{u2.id}/history', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+    assert len(resp.json) == 1
+
+def test_share_events_stream(client):
+    """Test that received shares are pushed live and replayed after Last-Event-ID."""
+    u1 = User(provider='test', provider_id='1', name='Sender')
+    u2 = User(provider='test', provider_id='2', name='Receiver')
+    db.session.add_all([u1, u2])
+    db.session.commit()
+    client.post('/api/friendships', json={'user_id': u1.id, 'friend_id': u2.id})
+    client.post('/api/shares', json={'sender_id': u1.id, 'friend_ids': [u2.id], 'url': 'http://first.example'})
+
+    resp = client.get(f'/api/users/{u2.id}/events', headers={'Last-Event-ID': '0'})
+    assert resp.mimetype == 'text/event-stream'
+    stream = iter(resp.response)
+    assert next(stream).decode() == 'retry: 1000\n\n'
+    replayed = next(stream).decode()
+    assert 'http://first.example' in replayed and '"sender_name": "Sender"' in replayed
+
+    client.post('/api/shares', json={'sender_id': u1.id, 'friend_ids': [u2.id], 'url': 'http://second.example'})
+    live = next(stream).decode()
+    assert 'http://second.example' in live
+    assert int(live.split('\n')[0][len('id: '):]) > int(replayed.split('\n')[0][len('id: '):])
+    resp.close()
+    assert len(app_module.broker) == 0
+
+def test_share_events_stream_ends_and_unsubscribes(client, monkeypatch):
+    """Test that an event stream ends by itself and frees its subscription without close()."""
+    monkeypatch.setattr(app_module, 'SSE_STREAM_SECONDS', 0.2)
+    monkeypatch.setattr(app_module, 'SSE_HEARTBEAT', 0.05)
+    u1 = User(provider='test', provider_id='1', name='Viewer')
+    db.session.add(u1)
+    db.session.commit()
+
+    resp = client.get(f'/api/users/{u1.id}/events')
+    assert len(app_module.broker) == 1
+    chunks = [chunk.decode() for chunk in resp.response]
+    assert chunks[:2] == ['retry: 1000\n\n', 'id: 0\n\n'] and ': keep-alive\n\n' in chunks
+    assert len(app_module.broker) == 0
+    resp.close()
+
+def test_upgrade_schema_is_idempotent(client):
+    """Test that migrations run on an unversioned database and are recorded once."""
+    assert app_module.upgrade_schema() == [2, 3, 4, 5]
+    assert app_module.upgrade_schema() == []
+    assert app_module.engine_options('sqlite:///:memory:') == {}
+    assert app_module.engine_options('sqlite:////data/poshbullet.db')['pool_pre_ping'] is True
+
+def test_health(client):
+    """Test the readiness probe used by main.py."""
+    resp = client.get('/health')
+    assert resp.status_code == 200
+    assert resp.json == {'status': 'ok'}
+
+def test_setup_runs_once_on_first_request(client, monkeypatch):
+    """Test that schema setup happens on the first request, not at import, and only once."""
+    calls = []
+    monkeypatch.setattr(app_module, 'prepare', lambda: calls.append(1))
+    app_module.prepared.clear()
+    assert client.get('/health').status_code == 200
+    assert client.get('/health').status_code == 200
+    assert calls == [1]
+
+def test_request_metrics_and_query_threshold(client, caplog, monkeypatch):
+    """Test that SQL statements are counted per request and exposed via Server-Timing and /metrics."""
+    u1 = User(provider='test', provider_id='1', name='User One')
+    db.session.add(u1)
+    db.session.commit()
+    monkeypatch.setattr(app_module, 'SQL_WARN_THRESHOLD', 1)
+
+    resp = client.get(f'/api/users/{u1.id}/friends')
+
+    timing = resp.headers.getlist('Server-Timing')
+    assert any(entry.startswith('db;') and 'queries"' in entry for entry in timing)
+    assert any(entry.startswith('app;') for entry in timing)
+    assert f'GET /api/users/{u1.id}/friends ran' in caplog.text
+
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'backend_sql_statements_count{route="/api/users/<int:user_id>/friends"}' in body
+    assert 'backend_request_seconds_bucket' in body
@@ -0,0 +1,8 @@
+"""Reproducible benchmarks for the share/history hot paths.
+
+    python -m benchmarks micro --users 1000 --shares 20000 --out micro.json
+    python -m benchmarks projections --users 5000 --shares 200000
+    python -m benchmarks load --spawn --duration 30 --out load.json
+    python -m benchmarks startup --runs 5 --out startup.json
+    python -m benchmarks compare before.json after.json
+"""
@@ -0,0 +1,72 @@
+import argparse
+
+try:
+    from . import load, micro, projections, startup
+    from .report import compare, print_table, write_results
+except ImportError:
+    import load
+    import micro
+    import projections
+    import startup
+    from report import compare, print_table, write_results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name in ('micro', 'projections', 'load'):
+        sub = commands.add_parser(name)
+        sub.add_argument('--users', type=int, default=200 if name == 'load' else 1000)
+        sub.add_argument('--shares', type=int, default=2000 if name == 'load' else 20000)
+        sub.add_argument('--edges-per-user', type=int, default=5)
+        sub.add_argument('--seed', type=int, default=42)
+        sub.add_argument('--out', help='write results as JSON to this path')
+    for name in ('micro', 'projections'):
+        commands.choices[name].add_argument('--requests', type=int, default=500)
+        commands.choices[name].add_argument('--database', help='DATABASE_URL to seed (default: temporary SQLite file)')
+    commands.choices['projections'].add_argument('--limit', type=int, default=200, help='history page size')
+    load_parser = commands.choices['load']
+    load_parser.add_argument('--backend-url', default='http://localhost:8081')
+    load_parser.add_argument('--frontend-url', default='http://localhost:8080')
+    load_parser.add_argument('--concurrency', type=int, default=16)
+    load_parser.add_argument('--duration', type=float, default=30)
+    load_parser.add_argument('--spawn', action='store_true', help='start main.py for the duration of the run')
+
+    startup_parser = commands.add_parser('startup')
+    startup_parser.add_argument('--runs', type=int, default=5)
+    startup_parser.add_argument('--development', action='store_true', help='time the reloading dev mode instead')
+    startup_parser.add_argument('--inprocess', action='store_true', help='BACKEND_INPROCESS=1: frontend only')
+    startup_parser.add_argument('--timeout', type=float, default=60)
+    startup_parser.add_argument('--out', help='write results as JSON to this path')
+
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+
+    args = parser.parse_args(argv)
+    if args.command == 'compare':
+        compare(args.before, args.after)
+        return
+
+    params = {k: v for k, v in vars(args).items() if k not in ('command', 'out')}
+    if args.command == 'micro':
+        results = micro.run(users=args.users, shares=args.shares, edges_per_user=args.edges_per_user,
+                            requests=args.requests, seed=args.seed, database=args.database)
+    elif args.command == 'projections':
+        results = projections.run(users=args.users, shares=args.shares, edges_per_user=args.edges_per_user,
+                                  requests=args.requests, limit=args.limit, seed=args.seed, database=args.database)
+    elif args.command == 'startup':
+        results = startup.run(runs=args.runs, production=not args.development, inprocess=args.inprocess,
+                              timeout=args.timeout)
+    else:
+        results = load.run(backend_url=args.backend_url, frontend_url=args.frontend_url, users=args.users,
+                           shares=args.shares, edges_per_user=args.edges_per_user, concurrency=args.concurrency,
+                           duration=args.duration, seed=args.seed, spawn=args.spawn)
+    print_table(results)
+    if args.out:
+        write_results(args.out, args.command, params, results)
+
+
+if __name__ == '__main__':
+    main()
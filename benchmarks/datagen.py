@@ -0,0 +1,96 @@
+"""Synthetic data: users, a power-law friend graph and share traffic."""
+import datetime
+import random
+
+
+def friend_graph(users, edges_per_user, rng):
+    """Preferential-attachment (Barabasi-Albert) graph over user indexes 0..users-1.
+
+    Returns undirected edges as (a, b) pairs with a > b. Degrees follow a power
+    law, so a few users have very large friend lists and histories.
+    """
+    edges = set()
+    by_degree = []  # each node repeated once per incident edge
+    for node in range(1, users):
+        wanted = min(edges_per_user, node)
+        chosen = set()
+        while len(chosen) < wanted:
+            chosen.add(rng.choice(by_degree) if by_degree and rng.random() < 0.9 else rng.randrange(node))
+        for other in chosen:
+            edges.add((node, other))
+            by_degree += [node, other]
+    return sorted(edges)
+
+
+def share_stream(edges, shares, rng, start=None):
+    """Yields (sender, receiver, url, timestamp) for `shares` shares along graph edges.
+
+    Senders are picked proportionally to their degree and URLs from a Zipf-like
+    popularity distribution, so some links recur across many users.
+    """
+    adjacency = {}
+    for a, b in edges:
+        adjacency.setdefault(a, []).append(b)
+        adjacency.setdefault(b, []).append(a)
+    weighted = [node for a, b in edges for node in (a, b)]
+    timestamp = start or datetime.datetime(2025, 1, 1)
+    for _ in range(shares):
+        sender = rng.choice(weighted)
+        receiver = rng.choice(adjacency[sender])
+        popularity = int(rng.paretovariate(1.2))
+        url = f'https://site{popularity % 500}.example/articles/{popularity}'
+        timestamp += datetime.timedelta(seconds=rng.randint(1, 120))
+        yield sender, receiver, url, timestamp
+
+
+def populate(db, users=1000, shares=20000, edges_per_user=5, seed=42, chunk_size=5000):
+    """Bulk-loads a fresh backend database; returns {index: user_id} and the edge list.
+
+    Writes go straight through Core inserts (users, friendships, interned urls,
+    shared_urls and user_timeline) rather than the HTTP API.
+    """
+    from sqlalchemy import func, insert, select
+    from backend.app import Friendship, SharedUrl, TimelineEntry, User, intern_urls, normalize_url, timeline_rows
+
+    rng = random.Random(seed)
+    db.session.execute(insert(User), [
+        {'provider': 'bench', 'provider_id': str(i), 'name': f'Bench User {i}', 'email': f'user{i}@bench.example'}
+        for i in range(users)
+    ])
+    ids = {int(pid): uid for pid, uid in db.session.execute(
+        select(User.provider_id, User.id).where(User.provider == 'bench')
+    )}
+    names = {uid: f'Bench User {i}' for i, uid in ids.items()}
+
+    edges = friend_graph(users, edges_per_user, rng)
+    db.session.execute(insert(Friendship), [
+        row for a, b in edges for row in (
+            {'user_id': ids[a], 'friend_id': ids[b]}, {'user_id': ids[b], 'friend_id': ids[a]}
+        )
+    ])
+
+    next_id = (db.session.scalar(select(func.max(SharedUrl.id))) or 0) + 1
+    batch = []
+    for sender, receiver, url, timestamp in share_stream(edges, shares, rng):
+        batch.append({'id': next_id, 'sender_id': ids[sender], 'receiver_id': ids[receiver],
+                      'url': normalize_url(url), 'timestamp': timestamp})
+        next_id += 1
+        if len(batch) == chunk_size:
+            _write_shares(db, batch, names, intern_urls, SharedUrl, TimelineEntry, timeline_rows)
+            batch = []
+    if batch:
+        _write_shares(db, batch, names, intern_urls, SharedUrl, TimelineEntry, timeline_rows)
+    db.session.commit()
+    return ids, edges
+
+
+def _write_shares(db, batch, names, intern_urls, SharedUrl, TimelineEntry, timeline_rows):
+    from sqlalchemy import insert
+
+    url_ids = intern_urls({share['url'] for share in batch})
+    for share in batch:
+        share['url_id'] = url_ids[share['url']]
+    db.session.execute(insert(SharedUrl), [
+        {k: share[k] for k in ('id', 'sender_id', 'receiver_id', 'url_id', 'timestamp')} for share in batch
+    ])
+    db.session.execute(insert(TimelineEntry), [row for share in batch for row in timeline_rows(share, names)])
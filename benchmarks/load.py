@@ -0,0 +1,134 @@
+"""Concurrent end-to-end load against the two-service stack started by main.py."""
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+try:
+    from .datagen import friend_graph, share_stream
+    from .report import summarize
+except ImportError:
+    from datagen import friend_graph, share_stream
+    from report import summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Relative weights of the operations each virtual user picks from
+MIX = {
+    'frontend_dashboard': 3,
+    'frontend_history_partial': 2,
+    'backend_history': 4,
+    'backend_friends': 2,
+    'backend_share': 1,
+}
+
+
+def wait_ready(urls, timeout=60):
+    deadline = time.monotonic() + timeout
+    pending = list(urls)
+    while pending:
+        try:
+            if requests.get(pending[0], timeout=2).status_code < 500:
+                pending.pop(0)
+                continue
+        except requests.RequestException:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f'{pending[0]} did not become ready within {timeout}s')
+        time.sleep(0.5)
+
+
+def spawn_stack():
+    return subprocess.Popen([sys.executable, 'main.py'], cwd=ROOT)
+
+
+def seed_api(backend_url, users, shares, edges_per_user, seed, workers):
+    """Creates users, friendships and shares through the public API."""
+    rng = random.Random(seed)
+    session = requests.Session()
+
+    def create(index):
+        r = session.post(f'{backend_url}/api/users/auth', json={
+            'provider': 'bench', 'provider_id': str(index), 'name': f'Bench User {index}',
+            'email': f'user{index}@bench.example',
+        })
+        r.raise_for_status()
+        return index, r.json()['id']
+
+    with ThreadPoolExecutor(workers) as pool:
+        ids = dict(pool.map(create, range(users)))
+        edges = friend_graph(users, edges_per_user, rng)
+        list(pool.map(lambda e: session.post(f'{backend_url}/api/friendships', json={
+            'user_id': ids[e[0]], 'friend_id': ids[e[1]],
+        }).raise_for_status(), edges))
+        list(pool.map(lambda s: session.post(f'{backend_url}/api/shares', json={
+            'sender_id': ids[s[0]], 'friend_ids': [ids[s[1]]], 'url': s[2],
+        }).raise_for_status(), share_stream(edges, shares, rng)))
+
+    adjacency = {}
+    for a, b in edges:
+        adjacency.setdefault(ids[a], []).append(ids[b])
+        adjacency.setdefault(ids[b], []).append(ids[a])
+    return adjacency
+
+
+def run(backend_url='http://localhost:8081', frontend_url='http://localhost:8080', users=200, shares=2000,
+        edges_per_user=5, concurrency=16, duration=30, seed=42, spawn=False):
+    """Seeds the running stack, then drives the operation mix for `duration` seconds."""
+    proc = spawn_stack() if spawn else None
+    try:
+        wait_ready([f'{backend_url}/api/users?ids=1', frontend_url])
+        adjacency = seed_api(backend_url, users, shares, edges_per_user, seed, concurrency)
+        weighted = [uid for uid, friends in adjacency.items() for _ in friends]
+        operations = list(MIX)
+        weights = [MIX[name] for name in operations]
+        samples = {name: [] for name in operations}
+        errors = {name: 0 for name in operations}
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def virtual_user(worker):
+            rng = random.Random(seed * 1000 + worker)
+            backend_session = requests.Session()
+            frontend_session = requests.Session()
+            frontend_session.get(f'{frontend_url}/auth/callback/google?mock=true')
+            while time.monotonic() < deadline:
+                name = rng.choices(operations, weights)[0]
+                user_id = rng.choice(weighted)
+                t0 = time.perf_counter()
+                try:
+                    if name == 'frontend_dashboard':
+                        r = frontend_session.get(f'{frontend_url}/')
+                    elif name == 'frontend_history_partial':
+                        r = frontend_session.get(f'{frontend_url}/api/history_partial')
+                    elif name == 'backend_history':
+                        r = backend_session.get(f'{backend_url}/api/users/{user_id}/history')
+                    elif name == 'backend_friends':
+                        r = backend_session.get(f'{backend_url}/api/users/{user_id}/friends')
+                    else:
+                        r = backend_session.post(f'{backend_url}/api/shares', json={
+                            'sender_id': user_id, 'friend_ids': [rng.choice(adjacency[user_id])],
+                            'url': f'https://bench.example/load/{worker}/{rng.random()}',
+                        })
+                    failed = r.status_code >= 400
+                except requests.RequestException:
+                    failed = True
+                elapsed = time.perf_counter() - t0
+                with lock:
+                    samples[name].append(elapsed)
+                    errors[name] += failed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(virtual_user, range(concurrency)))
+        wall = time.perf_counter() - started
+        return {name: summarize(samples[name], errors[name], wall) for name in operations}
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
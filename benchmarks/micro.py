@@ -0,0 +1,80 @@
+"""In-process micro-benchmarks of the backend hot paths via the Flask test client."""
+import os
+import random
+import tempfile
+import time
+
+try:
+    from .report import summarize
+except ImportError:
+    from report import summarize
+
+ENDPOINTS = ('auth_user', 'share_url', 'get_friends', 'get_history', 'get_dashboard')
+
+
+def timed(fn, requests):
+    """Runs `fn` `requests` times; returns (latencies, errors, elapsed)."""
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for i in range(requests):
+        t0 = time.perf_counter()
+        response = fn(i)
+        latencies.append(time.perf_counter() - t0)
+        if response.status_code >= 400:
+            errors += 1
+    return latencies, errors, time.perf_counter() - started
+
+
+def run(users=1000, shares=20000, edges_per_user=5, requests=500, seed=42, database=None):
+    """Seeds a fresh database and times each endpoint; returns {endpoint: summary}."""
+    workdir = None
+    if database is None:
+        workdir = tempfile.mkdtemp(prefix='bench-')
+        database = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    # The backend reads its storage settings at import time
+    os.environ['DATABASE_URL'] = database
+    from backend.app import app, db, upgrade_schema
+    try:
+        from .datagen import populate
+    except ImportError:
+        from datagen import populate
+
+    with app.app_context():
+        upgrade_schema()
+        ids, edges = populate(db, users=users, shares=shares, edges_per_user=edges_per_user, seed=seed)
+
+    adjacency = {}
+    for a, b in edges:
+        adjacency.setdefault(ids[a], []).append(ids[b])
+        adjacency.setdefault(ids[b], []).append(ids[a])
+    # Sample readers by degree so heavy users show up in the tail as they would in production
+    weighted = [uid for uid, friends in adjacency.items() for _ in friends]
+    rng = random.Random(seed)
+    client = app.test_client()
+
+    def auth_user(i):
+        index = rng.randrange(users)
+        return client.post('/api/users/auth', json={
+            'provider': 'bench', 'provider_id': str(index), 'name': f'Bench User {index}',
+            'email': f'user{index}@bench.example',
+        })
+
+    def share_url(i):
+        sender = rng.choice(weighted)
+        return client.post('/api/shares', json={
+            'sender_id': sender, 'friend_ids': [rng.choice(adjacency[sender])],
+            'url': f'https://bench.example/micro/{seed}/{i}',
+        })
+
+    cases = {
+        'auth_user': auth_user,
+        'share_url': share_url,
+        'get_friends': lambda i: client.get(f'/api/users/{rng.choice(weighted)}/friends'),
+        'get_history': lambda i: client.get(f'/api/users/{rng.choice(weighted)}/history'),
+        'get_dashboard': lambda i: client.get(f'/api/users/{rng.choice(weighted)}/dashboard'),
+    }
+    results = {}
+    for name in ENDPOINTS:
+        timed(cases[name], max(1, requests // 10))  # warm-up
+        results[name] = summarize(*timed(cases[name], requests))
+    return results
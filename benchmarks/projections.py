@@ -0,0 +1,82 @@
+"""Side-by-side timing of the list endpoints' queries: ORM-hydrated vs. column projections."""
+import os
+import random
+import tempfile
+import time
+
+try:
+    from .report import summarize
+except ImportError:
+    from report import summarize
+
+
+def orm_friends(user_id):
+    """Friends as the endpoint built them before: User instances hydrated, then flattened."""
+    from backend.app import Friendship, User
+    friends = User.query.join(Friendship, Friendship.friend_id == User.id).filter(
+        Friendship.user_id == user_id
+    ).all()
+    return [f.to_dict() for f in friends]
+
+
+def orm_history(user_id, limit):
+    """A history page as the endpoint built it before: TimelineEntry instances with their Url joined."""
+    from backend.app import TimelineEntry, User, db
+    entries = TimelineEntry.query.filter_by(user_id=user_id).order_by(
+        TimelineEntry.timestamp.desc(), TimelineEntry.share_id.desc()
+    ).limit(limit + 1).all()
+    user = db.session.get(User, user_id)
+    return [e.to_dict(user.name) for e in entries[:limit]]
+
+
+def timed(app, fn, user_ids, requests):
+    """Calls fn once per sampled user in a fresh app context, as a request would."""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(requests):
+        with app.app_context():
+            t0 = time.perf_counter()
+            fn(user_ids[i % len(user_ids)])
+            latencies.append(time.perf_counter() - t0)
+    return latencies, 0, time.perf_counter() - started
+
+
+def run(users=1000, shares=20000, edges_per_user=5, requests=500, limit=200, seed=42, database=None):
+    """Seeds a fresh database and times both implementations of each list; returns {case: summary}."""
+    if database is None:
+        database = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')}"
+    os.environ['DATABASE_URL'] = database
+    from backend.app import app, db, friend_list, history_page, upgrade_schema
+    try:
+        from .datagen import populate
+    except ImportError:
+        from datagen import populate
+
+    with app.app_context():
+        upgrade_schema()
+        ids, edges = populate(db, users=users, shares=shares, edges_per_user=edges_per_user, seed=seed)
+
+    degree = {}
+    for a, b in edges:
+        degree[ids[a]] = degree.get(ids[a], 0) + 1
+        degree[ids[b]] = degree.get(ids[b], 0) + 1
+    # The best-connected users have the longest friend lists and histories
+    heavy = sorted(degree, key=degree.get, reverse=True)[:max(1, users // 20)]
+    random.Random(seed).shuffle(heavy)
+
+    cases = {
+        'friends_orm': orm_friends,
+        'friends_rows': friend_list,
+        'history_orm': lambda user_id: orm_history(user_id, limit),
+        'history_rows': lambda user_id: history_page(user_id, limit)[0],
+    }
+    with app.app_context():
+        for user_id in heavy:
+            assert sorted(orm_friends(user_id), key=lambda f: f['id']) == friend_list(user_id)
+            assert orm_history(user_id, limit) == history_page(user_id, limit)[0]
+
+    results = {}
+    for name, fn in cases.items():
+        timed(app, fn, heavy, max(1, requests // 10))  # warm-up
+        results[name] = summarize(*timed(app, fn, heavy, requests))
+    return results
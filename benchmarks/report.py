@@ -0,0 +1,81 @@
+"""Latency summaries, JSON result files and run-to-run comparison."""
+import datetime
+import json
+import platform
+import subprocess
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, errors=0, elapsed=None):
+    """Throughput and latency percentiles (milliseconds) of one endpoint."""
+    values = sorted(latencies)
+    elapsed = elapsed if elapsed is not None else sum(values)
+    ms = lambda seconds: round(seconds * 1000, 3) if seconds is not None else None
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput_rps': round(len(values) / elapsed, 1) if elapsed else None,
+        'mean_ms': ms(sum(values) / len(values)) if values else None,
+        'p50_ms': ms(percentile(values, 50)),
+        'p95_ms': ms(percentile(values, 95)),
+        'p99_ms': ms(percentile(values, 99)),
+        'max_ms': ms(values[-1]) if values else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, kind, params, results):
+    document = {
+        'kind': kind,
+        'commit': git_commit(),
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': params,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2)
+    return document
+
+
+def print_table(results):
+    print(f"{'endpoint':<24}{'req':>8}{'err':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['requests']:>8}{r['errors']:>6}{r['throughput_rps'] or 0:>10}"
+              f"{r['p50_ms'] or 0:>10}{r['p95_ms'] or 0:>10}{r['p99_ms'] or 0:>10}")
+
+
+def compare(old_path, new_path):
+    """Prints per-endpoint relative change between two result files."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    print(f"{'endpoint':<24}{'rps':>12}{'p50':>12}{'p95':>12}{'p99':>12}")
+    for name, after in new['results'].items():
+        before = old['results'].get(name)
+        if not before:
+            continue
+        cells = []
+        for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            if before.get(key) and after.get(key) is not None:
+                cells.append(f"{(after[key] - before[key]) / before[key] * 100:+.1f}%")
+            else:
+                cells.append('n/a')
+        print(f"{name:<24}" + ''.join(f"{cell:>12}" for cell in cells))
@@ -0,0 +1,65 @@
+"""Cold-start timing: from launching main.py to each service's first successful response."""
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import requests
+
+try:
+    from .report import summarize
+except ImportError:
+    from report import summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cheapest successful request per service; the backend's also runs its first-request setup
+CHECKS = {
+    'backend': 'http://127.0.0.1:8081/health',
+    'frontend': 'http://127.0.0.1:8080/signup',
+}
+
+
+def first_success(url, started, proc, timeout):
+    """Seconds from `started` until `url` first answers 200."""
+    while time.monotonic() - started < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f'main.py exited with code {proc.returncode}')
+        try:
+            if requests.get(url, timeout=1, allow_redirects=False).status_code == 200:
+                return time.monotonic() - started
+        except requests.RequestException:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f'{url} did not answer within {timeout}s')
+
+
+def stop(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+    except ProcessLookupError:
+        pass
+
+
+def run(runs=5, production=True, inprocess=False, timeout=60):
+    """Starts and stops the stack `runs` times; returns {service: summary} of time to first success."""
+    env = dict(os.environ, RUN_MODE='production' if production else 'development',
+               BACKEND_INPROCESS='1' if inprocess else '0')
+    # In-process, the backend answers through the frontend, so only the frontend is timed
+    checks = {'frontend': CHECKS['frontend']} if inprocess else CHECKS
+    timings = {name: [] for name in checks}
+    for _ in range(runs):
+        started = time.monotonic()
+        proc = subprocess.Popen([sys.executable, 'main.py'], cwd=ROOT, env=env, start_new_session=True,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            for name, url in checks.items():
+                timings[name].append(first_success(url, started, proc, timeout))
+        finally:
+            stop(proc)
+    return {name: summarize(values) for name, values in timings.items()}
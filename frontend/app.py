@@ -1,9 +1,22 @@
 import os
+import sys
+import json
+import time
+import threading
 import requests
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
-from authlib.integrations.flask_client import OAuth
+from flask import (Flask, Response, render_template, stream_template, stream_with_context, request, redirect,
+                   url_for, session, jsonify, g, has_request_context)
+from markupsafe import Markup
 from dotenv import load_dotenv
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+try:
+    from .backend_client import BackendClient, BackendUnavailable
+    from .cache import Cache, LRUBackend
+except ImportError:
+    from backend_client import BackendClient, BackendUnavailable
+    from cache import Cache, LRUBackend
 
 load_dotenv()
 
@@ -13,15 +26,108 @@ app.config['SESSION_COOKIE_NAME'] = 'poshbullet-session'
 
 # Backend Config
 BACKEND_URL = os.getenv('BACKEND_URL', 'http://127.0.0.1:8081')
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 20))
+
+# Request metrics
+REQUEST_SECONDS = Histogram('frontend_request_seconds', 'Request latency', ['method', 'route', 'status'])
+BACKEND_SECONDS = Histogram('frontend_backend_call_seconds', 'Backend HTTP call latency', ['method', 'status'])
+BACKEND_CALLS = Histogram('frontend_backend_calls', 'Backend HTTP calls per request', ['route'],
+                          buckets=(0, 1, 2, 3, 5, 8, 13))
+CACHE_EVENTS = Gauge('frontend_cache_events', 'Cache lookups since start', ['cache', 'result'])
+BACKEND_FAILURES = Counter('frontend_backend_failures', 'Backend calls that failed or were refused', ['reason'])
+CIRCUIT_OPEN = Gauge('frontend_backend_circuit_open', '1 while the backend circuit breaker is open')
+
+def record_backend_call(method, url, response, seconds):
+    BACKEND_SECONDS.labels(method, response.status_code if response is not None else 'error').observe(seconds)
+    if not has_request_context():
+        return
+    g.backend_calls = g.get('backend_calls', 0) + 1
+    g.backend_seconds = g.get('backend_seconds', 0.0) + seconds
+    # Relay the backend's own breakdown, prefixed so it reads as a sub-span
+    if response is not None and 'Server-Timing' in response.headers:
+        g.setdefault('backend_timing', []).extend(
+            f'backend-{entry.strip()}' for entry in response.headers['Server-Timing'].split(',')
+        )
+
+def load_backend_app():
+    """Imports the backend Flask app from the sibling directory, for co-located deployments."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    from backend.app import app as backend_app
+    return backend_app
+
+def current_route():
+    return request.endpoint if has_request_context() else None
+
+# Co-located mode calls the backend app in-process instead of over loopback HTTP
+BACKEND_INPROCESS = os.getenv('BACKEND_INPROCESS') == '1'
+backend = BackendClient(observer=record_backend_call, app=load_backend_app() if BACKEND_INPROCESS else None,
+                        route_key=current_route)
+# Retry-After for backend failures that carry no better hint
+BACKEND_RETRY_AFTER = 5
+
+def note_backend_failure(message, e):
+    print(f"{message}: {e}")
+    BACKEND_FAILURES.labels(type(e).__name__).inc()
+
+def backend_unavailable(message, e):
+    """Fail-fast 503 for a backend call that was refused, timed out or failed."""
+    note_backend_failure(message, e)
+    retry_after = e.retry_after if isinstance(e, BackendUnavailable) else BACKEND_RETRY_AFTER
+    return message, 503, {'Retry-After': str(retry_after)}
+
+# Profiles and friend lists only change on login or new friendships
+cache = Cache(LRUBackend(max_entries=int(os.getenv('CACHE_MAX_ENTRIES', 4096))),
+              ttl=int(os.getenv('CACHE_TTL', 300)))
+
+# A rendered history item only changes with the viewer, the share and the names on it
+fragment_cache = Cache(LRUBackend(max_entries=int(os.getenv('FRAGMENT_CACHE_MAX_ENTRIES', 10000))),
+                       ttl=int(os.getenv('FRAGMENT_CACHE_TTL', 3600)))
+
+# Each open /events stream pins one of uvicorn's 10 WSGI threads and a backend
+# connection until the backend ends it (SSE_STREAM_SECONDS there), so only a few
+# may be open at once.
+sse_slots = threading.BoundedSemaphore(int(os.getenv('SSE_MAX_SUBSCRIBERS', 4)))
+SSE_READ_TIMEOUT = float(os.getenv('SSE_READ_TIMEOUT', 60))
+SSE_RECONNECT_MS = 1000
+# Tabs refused a stream poll the first history page instead, revalidating by ETag
+HISTORY_POLL_SECONDS = int(os.getenv('HISTORY_POLL_SECONDS', 30))
+
+# Export downloads are relayed chunk by chunk, never buffered whole
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
 
-# OAuth Setup
-oauth = OAuth(app)
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.pop('request_started', time.perf_counter())
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    calls, backend_seconds = g.get('backend_calls', 0), g.get('backend_seconds', 0.0)
+    REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(elapsed)
+    BACKEND_CALLS.labels(route).observe(calls)
+    response.headers.add('Server-Timing', f'backend;dur={backend_seconds * 1000:.1f};desc="{calls} calls"')
+    for entry in g.get('backend_timing', []):
+        response.headers.add('Server-Timing', entry)
+    response.headers.add('Server-Timing', f'app;dur={(elapsed - backend_seconds) * 1000:.1f}')
+    return response
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+def friends_key(user_id):
+    return f'friends:{user_id}'
+
+# OAuth Setup: providers are only described here. authlib (and the crypto stack
+# behind it) is imported and the clients registered on the first real login.
+OAUTH_PROVIDERS = {}
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
 
 if GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET:
-    oauth.register(
-        name='google',
+    OAUTH_PROVIDERS['google'] = dict(
         client_id=GOOGLE_CLIENT_ID,
         client_secret=GOOGLE_CLIENT_SECRET,
         server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
@@ -32,8 +138,7 @@ FACEBOOK_CLIENT_ID = os.getenv('FACEBOOK_CLIENT_ID')
 FACEBOOK_CLIENT_SECRET = os.getenv('FACEBOOK_CLIENT_SECRET')
 
 if FACEBOOK_CLIENT_ID and FACEBOOK_CLIENT_SECRET:
-    oauth.register(
-        name='facebook',
+    OAUTH_PROVIDERS['facebook'] = dict(
         client_id=FACEBOOK_CLIENT_ID,
         client_secret=FACEBOOK_CLIENT_SECRET,
         api_base_url='https://graph.facebook.com/v18.0/',
@@ -42,6 +147,52 @@ if FACEBOOK_CLIENT_ID and FACEBOOK_CLIENT_SECRET:
         client_kwargs={'scope': 'email'}
     )
 
+oauth = None
+oauth_lock = threading.Lock()
+
+def oauth_client(provider):
+    global oauth
+    if oauth is None:
+        with oauth_lock:
+            if oauth is None:
+                from authlib.integrations.flask_client import OAuth
+                registry = OAuth(app)
+                for name, options in OAUTH_PROVIDERS.items():
+                    registry.register(name=name, **options)
+                oauth = registry
+    return oauth.create_client(provider)
+
+def history_fragments(history, user_id):
+    """Yields the rendered history items, reusing cached fragments by share ID and names."""
+    for item in history:
+        # Names are part of the key so a renamed user never shows under an old fragment
+        key = f"{user_id}:{item['id']}:{item['sender_name']!r}:{item['receiver_name']!r}"
+        fragment = fragment_cache.get(key)
+        if fragment is None:
+            fragment = render_template('partials/history_item.html', item=item, user_id=user_id)
+            fragment_cache.set(key, fragment)
+        yield Markup(fragment)
+
+def sse_events(resp):
+    """Parses a backend SSE stream into (event_id, data) pairs.
+
+    Heartbeats yield (None, None) and events that only carry an ID (event_id, None).
+    """
+    event_id, data = None, []
+    for line in resp.iter_lines(chunk_size=None, decode_unicode=True):
+        if not line:
+            if data:
+                yield event_id, '\n'.join(data)
+            elif event_id is not None:
+                yield event_id, None
+            event_id, data = None, []
+        elif line.startswith(':'):
+            yield None, None
+        elif line.startswith('id:'):
+            event_id = line[3:].strip()
+        elif line.startswith('data:'):
+            data.append(line[5:].lstrip())
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -50,29 +201,53 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+@app.route('/metrics')
+def metrics():
+    for name, c in (('data', cache), ('fragments', fragment_cache)):
+        stats = c.stats()
+        CACHE_EVENTS.labels(name, 'hit').set(stats['hits'])
+        CACHE_EVENTS.labels(name, 'miss').set(stats['misses'])
+    CIRCUIT_OPEN.set(backend.breaker.state != 'closed')
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
 @app.route('/')
 def index():
-    user = None
     if 'user_id' in session:
+        user_id = session['user_id']
+        user = cache.get(user_key(user_id))
+        friends = cache.get(friends_key(user_id))
+        fields = ['history']
+        if user is None:
+            fields.append('user')
+        if friends is None:
+            fields.append('friends')
         try:
-            r = requests.get(f"{BACKEND_URL}/api/users/{session['user_id']}")
-            if r.status_code == 200:
-                user = r.json()
-            elif r.status_code == 404:
+            r = backend.get(f"{BACKEND_URL}/api/users/{user_id}/dashboard",
+                            params={'limit': HISTORY_PAGE_SIZE, 'fields': ','.join(fields)})
+            if r.status_code == 404:
                 # Session exists but user not in DB (likely DB reset). Logout.
                 session.clear()
+                cache.invalidate(user_key(user_id), friends_key(user_id))
                 return redirect(url_for('index'))
+            r.raise_for_status()
+            dashboard = r.json()
+            if user is None:
+                user = dashboard['user']
+                cache.set(user_key(user_id), user)
+            if friends is None:
+                friends = dashboard['friends']
+                cache.set(friends_key(user_id), friends)
             
-            friends_resp = requests.get(f"{BACKEND_URL}/api/users/{session['user_id']}/friends")
-            friends = friends_resp.json() if friends_resp.status_code == 200 else []
-
-            hist_resp = requests.get(f"{BACKEND_URL}/api/users/{session['user_id']}/history")
-            history = hist_resp.json() if hist_resp.status_code == 200 else []
-            
-            return render_template('index.html', user=user, friends=friends, history=history)
+            return render_template('index.html', user=user, friends=friends,
+                                   fragments=history_fragments(dashboard['history'], user_id),
+                                   next_cursor=dashboard['next_cursor'], poll_seconds=HISTORY_POLL_SECONDS)
         except requests.RequestException as e:
-            print(f"Backend connection failed: {e}")
-            return "Error connecting to backend service", 503
+            if user is None:
+                return backend_unavailable("Error connecting to backend service", e)
+            # The profile still renders from cache; friends and history are optional
+            note_backend_failure("Dashboard degraded", e)
+            return render_template('index.html', user=user, friends=friends or [], fragments=[],
+                                   next_cursor=None, degraded=True, poll_seconds=HISTORY_POLL_SECONDS)
             
     return render_template('index.html', user=None)
 
@@ -90,7 +265,7 @@ def login(provider):
     if provider == 'facebook' and not FACEBOOK_CLIENT_ID:
         return redirect(url_for('auth_callback', provider=provider, mock='true'))
     redirect_uri = url_for('auth_callback', provider=provider, _external=True)
-    return oauth.create_client(provider).authorize_redirect(redirect_uri)
+    return oauth_client(provider).authorize_redirect(redirect_uri)
 
 @app.route('/auth/callback/<provider>')
 def auth_callback(provider):
@@ -102,7 +277,7 @@ def auth_callback(provider):
             'picture': f'https://ui-avatars.com/api/?name={provider}'
         }
     else:
-        client = oauth.create_client(provider)
+        client = oauth_client(provider)
         token = client.authorize_access_token()
         if provider == 'google':
             user_info = token.get('userinfo') or client.userinfo()
@@ -123,20 +298,26 @@ def auth_callback(provider):
         'email': user_info.get('email'),
         'avatar_url': user_info.get('picture')
     }
+    # The backend creates the pending-invite friendship in the same call; the
+    # invite stays pending until that call succeeds.
+    invite_sender_id = session.get('pending_invite_sender')
+    if invite_sender_id:
+        payload['invite_friend_id'] = invite_sender_id
     
     try:
-        r = requests.post(f"{BACKEND_URL}/api/users/auth", json=payload)
+        r = backend.post(f"{BACKEND_URL}/api/users/auth", json=payload)
         r.raise_for_status()
         user_data = r.json()
+        session.pop('pending_invite_sender', None)
         session['user_id'] = user_data['id']
-        
-        invite_sender_id = session.pop('pending_invite_sender', None)
+        # Login may have refreshed the profile, which friends see in their lists
+        cache.invalidate(user_key(user_data['id']),
+                         *(friends_key(friend_id) for friend_id in user_data.get('refreshed_friend_ids', [])))
         if invite_sender_id and invite_sender_id != user_data['id']:
-            requests.post(f"{BACKEND_URL}/api/friendships", json={
-                'user_id': user_data['id'],
-                'friend_id': invite_sender_id
-            })
+            cache.invalidate(friends_key(user_data['id']), friends_key(invite_sender_id))
 
+    except BackendUnavailable as e:
+        return backend_unavailable("Authentication via backend failed", e)
     except Exception as e:
         print(f"Auth failed: {e}")
         return "Authentication via backend failed", 500
@@ -161,12 +342,14 @@ def handle_invite(inviter_id):
              return "You cannot invite yourself.", 400
         
         try:
-            requests.post(f"{BACKEND_URL}/api/friendships", json={
+            r = backend.post(f"{BACKEND_URL}/api/friendships", json={
                 'user_id': session['user_id'],
                 'friend_id': inviter_id
             })
-        except:
-            pass
+            r.raise_for_status()
+        except requests.RequestException as e:
+            return backend_unavailable("Could not accept the invitation", e)
+        cache.invalidate(friends_key(session['user_id']), friends_key(inviter_id))
         return redirect(url_for('index'))
     else:
         session['pending_invite_sender'] = inviter_id
@@ -187,28 +370,15 @@ def share_url():
             'friend_ids': friend_ids,
             'url': url
         }
-        r = requests.post(f"{BACKEND_URL}/api/shares", json=payload)
+        r = backend.post(f"{BACKEND_URL}/api/shares", json=payload)
+        if r.status_code == 422:
+            return "None of the selected friends can receive this link", 422
         r.raise_for_status()
 
-        new_items_html = ""
-        for fid in friend_ids:
-             f_resp = requests.get(f"{BACKEND_URL}/api/users/{fid}")
-             friend_data = f_resp.json()
-             receiver_name = friend_data['name']
-             
-             new_items_html += f'''
-                <div class="flex flex-col p-4 rounded-xl mb-3 border-l-4 border-indigo-500 bg-indigo-500/10 fade-in">
-                    <div class="flex justify-between items-center mb-2">
-                        <span class="text-xs font-bold text-slate-400">Just now</span>
-                        <span class="text-xs px-3 py-1 rounded-full bg-indigo-500/20 text-indigo-300 border border-white/5">
-                            You &rarr; {receiver_name}
-                        </span>
-                    </div>
-                    <a href="{url}" target="_blank" class="text-blue-400 font-medium truncate">{url}</a>
-                </div>
-             '''
-        return new_items_html
+        return render_template('partials/share_items.html', shares=r.json()['shares'])
 
+    except BackendUnavailable as e:
+        return backend_unavailable("Error sharing URL", e)
     except Exception as e:
         print(f"Share failed: {e}")
         return "Error sharing URL", 500
@@ -216,34 +386,128 @@ def share_url():
 @app.route('/api/history_partial')
 @login_required
 def history_partial():
+     user_id = session['user_id']
+     cursor = request.args.get('cursor')
      try:
-        hist_resp = requests.get(f"{BACKEND_URL}/api/users/{session['user_id']}/history")
-        history = hist_resp.json() if hist_resp.status_code == 200 else []
-        
-        html = ""
-        for item in history:
-            user_id = session['user_id']
-            is_me = (item['sender_id'] == user_id)
-            direction = "You sent to" if is_me else "sent you"
-            other_person = item['receiver_name'] if is_me else item['sender_name']
-            style = "border-l-4 border-indigo-500 bg-indigo-500/10" if is_me else "border-l-4 border-emerald-500 bg-emerald-500/10"
-            
-            html += f'''
-            <div class="flex flex-col p-4 rounded-xl mb-3 {style} hover:bg-white/5 transition-colors">
-                <div class="flex justify-between items-center mb-2">
-                    <span class="text-xs font-bold text-slate-400">{item['timestamp']}</span>
-                    <span class="text-xs px-3 py-1 rounded-full border border-white/5 {'bg-indigo-500/20 text-indigo-300' if is_me else 'bg-emerald-500/20 text-emerald-300'}">
-                        {direction} {other_person}
-                    </span>
-                </div>
-                <a href="{item['url']}" target="_blank" class="text-blue-400 hover:text-blue-300 font-medium truncate py-1 block flex items-center gap-2">
-                   {item['url']}
-                </a>
-            </div>
-            '''
-        return html
-     except:
-         return "Error loading history"
+        params = {'limit': HISTORY_PAGE_SIZE}
+        if cursor:
+            params['cursor'] = cursor
+        headers = {'If-None-Match': request.headers['If-None-Match']} if 'If-None-Match' in request.headers else {}
+        hist_resp = backend.get(f"{BACKEND_URL}/api/users/{user_id}/history", params=params, headers=headers)
+        etag = hist_resp.headers.get('ETag')
+        if hist_resp.status_code == 304:
+            return Response(status=304, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+        hist_resp.raise_for_status()
+        history = hist_resp.json()
+        next_cursor = hist_resp.headers.get('X-Next-Cursor')
+     except requests.RequestException as e:
+         return backend_unavailable("Error loading history", e)
+
+     # stream_template keeps the request context alive (stream_with_context) while
+     # the items are rendered and sent out one by one.
+     resp = Response(stream_template('partials/history_page.html',
+                                     fragments=history_fragments(history, user_id),
+                                     cursor=cursor, next_cursor=next_cursor))
+     if etag:
+         # The browser revalidates with If-None-Match, which is passed through above.
+         resp.headers['ETag'] = etag
+         resp.headers['Cache-Control'] = 'private, no-cache'
+     return resp
+
+@app.route('/api/history_search')
+@login_required
+def history_search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return history_partial()
+
+    user_id = session['user_id']
+    cursor = request.args.get('cursor')
+    params = {'q': query, 'limit': HISTORY_PAGE_SIZE}
+    if cursor:
+        params['cursor'] = cursor
+    try:
+        resp = backend.get(f"{BACKEND_URL}/api/users/{user_id}/history/search", params=params)
+        # 400 means nothing searchable in the query (e.g. only punctuation)
+        if resp.status_code != 400:
+            resp.raise_for_status()
+    except requests.RequestException as e:
+        return backend_unavailable("Error searching history", e)
+    results = resp.json() if resp.status_code == 200 else []
+
+    return Response(stream_template('partials/history_page.html',
+                                    fragments=history_fragments(results, user_id), query=query,
+                                    cursor=cursor, next_cursor=resp.headers.get('X-Next-Cursor')))
+
+@app.route('/export')
+@login_required
+def export_history():
+    """Relays the backend's streamed history export as a download, still compressed if it was."""
+    user_id = session['user_id']
+    params = {k: request.args[k] for k in ('format', 'since', 'until') if k in request.args}
+    headers = {'Accept-Encoding': request.headers.get('Accept-Encoding', 'identity')}
+    try:
+        upstream = backend.get(f"{BACKEND_URL}/api/users/{user_id}/history/export", params=params,
+                               headers=headers, stream=True)
+    except requests.RequestException as e:
+        return backend_unavailable("Error exporting history", e)
+    if upstream.status_code != 200:
+        upstream.close()
+        return "Could not export history", upstream.status_code if upstream.status_code < 500 else 502
+
+    relayed = {k: upstream.headers[k] for k in ('Content-Disposition', 'Content-Encoding', 'Vary')
+               if k in upstream.headers}
+    resp = Response(upstream.raw.stream(EXPORT_CHUNK_SIZE, decode_content=False),
+                    content_type=upstream.headers.get('Content-Type'), headers=relayed)
+    resp.call_on_close(upstream.close)
+    return resp
+
+@app.route('/events')
+@login_required
+def events():
+    """Relays the backend's new-share events as rendered history items for htmx's SSE extension."""
+    if not sse_slots.acquire(blocking=False):
+        return "Too many open event streams", 503, {'Retry-After': '5'}
+
+    user_id = session['user_id']
+    headers = {'Last-Event-ID': request.headers['Last-Event-ID']} if 'Last-Event-ID' in request.headers else {}
+    try:
+        upstream = backend.get(f"{BACKEND_URL}/api/users/{user_id}/events", headers=headers, stream=True,
+                               timeout=(backend.timeout[0], SSE_READ_TIMEOUT))
+        upstream.raise_for_status()
+        upstream.encoding = 'utf-8'
+    except requests.RequestException as e:
+        sse_slots.release()
+        return backend_unavailable("Error connecting to backend service", e)
+
+    closing = threading.Lock()
+
+    def close():
+        # Runs from the generator's finally and from call_on_close, whichever comes first
+        if closing.acquire(blocking=False):
+            upstream.close()
+            sse_slots.release()
+
+    def generate():
+        try:
+            yield f'retry: {SSE_RECONNECT_MS}\n\n'
+            for event_id, data in sse_events(upstream):
+                if data is None:
+                    yield f'id: {event_id}\n\n' if event_id is not None else ': keep-alive\n\n'
+                    continue
+                fragment = next(history_fragments([json.loads(data)], user_id))
+                lines = ''.join(f'data: {line}\n' for line in fragment.splitlines())
+                yield f'id: {event_id}\nevent: share\n{lines}\n'
+        except requests.RequestException:
+            pass
+        finally:
+            # The browser's EventSource reconnects with Last-Event-ID.
+            close()
+
+    resp = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    resp.call_on_close(close)
+    return resp
 
 if __name__ == '__main__':
     host = os.getenv('HOST', '0.0.0.0')
@@ -0,0 +1,283 @@
+"""Pooled, keep-alive HTTP client shared by every frontend-to-backend call."""
+import io
+import os
+import sys
+import math
+import time
+import threading
+import contextvars
+from urllib.parse import urlsplit, unquote_to_bytes
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.util.retry import Retry
+
+
+class BackendUnavailable(requests.RequestException):
+    """A backend call the gateway refused to make; retry_after is a hint in seconds."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(BackendUnavailable):
+    pass
+
+
+class BackendSaturated(BackendUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and fails calls fast while open.
+
+    Once `reset_timeout` seconds have passed, a single trial call is let through:
+    success closes the circuit, failure opens it for another period.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'half-open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def reset(self):
+        with self.lock:
+            self.failures, self.opened_at, self.trial = 0, None, False
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self.trial:
+                raise CircuitOpen('Backend circuit is open', max(1, math.ceil(remaining)))
+            self.trial = True
+
+    def record(self, ok):
+        with self.lock:
+            self.trial = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class RefusalAwareRetry(Retry):
+    """GET retries that leave deliberate refusals to the caller.
+
+    An answer carrying Retry-After (e.g. the backend's cap on event streams) is
+    the backend shedding load on purpose; retrying it only holds a thread.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        return not has_retry_after and super().is_retry(method, status_code, has_retry_after)
+
+
+def backend_failed(response):
+    """Whether a call counts against the circuit breaker; refusals with Retry-After do not."""
+    if response is None:
+        return True
+    return response.status_code in (500, 502, 503, 504) and 'Retry-After' not in response.headers
+
+
+class WSGIBody:
+    """File-like response body that pulls chunks from a WSGI app iterator as they are produced.
+
+    The iterator runs in the context the app was called in: a streamed Flask
+    response re-pushes the backend's request context while it iterates, which
+    must not leak into the caller's own context stack.
+    """
+
+    def __init__(self, app_iter, context):
+        self.app_iter = app_iter
+        self.context = context
+        self.chunks = iter(app_iter)
+        self.closed = False
+
+    def stream(self, amt=None, decode_content=None):
+        try:
+            while True:
+                chunk = self.context.run(next, self.chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    yield chunk
+        finally:
+            self.close()
+
+    def read(self, amt=None, decode_content=None):
+        return b''.join(self.stream())
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            if hasattr(self.app_iter, 'close'):
+                self.context.run(self.app_iter.close)
+
+
+class WSGIAdapter(BaseAdapter):
+    """requests transport that calls a WSGI app in-process instead of opening a socket.
+
+    Timeouts and retries do not apply: there is no connection to wait on.
+    """
+
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        body = request.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(url.path or '/').decode('latin-1'),
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': url.hostname or 'localhost',
+            'SERVER_PORT': str(url.port or (443 if url.scheme == 'https' else 80)),
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': url.scheme,
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in request.headers.items():
+            key = name.upper().replace('-', '_')
+            if key == 'CONTENT_TYPE':
+                environ[key] = value
+            elif key != 'CONTENT_LENGTH':
+                environ[f'HTTP_{key}'] = value
+
+        started = {}
+        def start_response(status, headers, exc_info=None):
+            started['status'], started['headers'] = status, headers
+            return lambda data: None
+
+        context = contextvars.copy_context()
+        response = requests.Response()
+        response.raw = WSGIBody(context.run(self.app, environ, start_response), context)
+        code, _, reason = started['status'].partition(' ')
+        response.status_code = int(code)
+        response.reason = reason
+        # Repeated headers are folded the way urllib3 does it
+        headers = CaseInsensitiveDict()
+        for name, value in started['headers']:
+            headers[name] = f'{headers[name]}, {value}' if name in headers else value
+        response.headers = headers
+        response.encoding = get_encoding_from_headers(headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+class BackendClient:
+    """Thin wrapper over a requests.Session with a sized pool, timeouts and GET retries.
+
+    Call sites pass full URLs exactly as they would to `requests`, so the
+    client stays independent of where the backend lives. Given a WSGI `app`,
+    every call is dispatched to it in-process instead. `observer`, if set, is
+    called as observer(method, url, response, seconds) after every call; response
+    is None when the call raised.
+
+    Calls are admitted through a circuit breaker, which counts connection errors,
+    timeouts and 500/502/503/504 answers as failures, except answers with Retry-After.
+    Those are deliberate refusals and are not retried either. Each route then gets at most
+    `route_limit` calls in flight, where the route is whatever `route_key()`
+    returns. Refused calls raise BackendUnavailable without reaching the backend.
+    """
+
+    def __init__(self, pool_size=None, connect_timeout=None, read_timeout=None, retries=None, observer=None,
+                 app=None, route_key=None, route_limit=None, breaker=None):
+        self.observer = observer
+        self.route_key = route_key
+        self.route_limit = route_limit or int(os.getenv('BACKEND_ROUTE_CONCURRENCY', 8))
+        self.admission_timeout = float(os.getenv('BACKEND_ADMISSION_TIMEOUT', 0.1))
+        self.breaker = breaker or CircuitBreaker(
+            threshold=int(os.getenv('BACKEND_BREAKER_THRESHOLD', 5)),
+            reset_timeout=float(os.getenv('BACKEND_BREAKER_RESET', 30)),
+        )
+        self.route_slots = {}
+        self.lock = threading.Lock()
+        pool_size = pool_size or int(os.getenv('BACKEND_POOL_SIZE', 20))
+        retries = int(os.getenv('BACKEND_RETRIES', 2)) if retries is None else retries
+        self.timeout = (
+            connect_timeout or float(os.getenv('BACKEND_CONNECT_TIMEOUT', 2)),
+            read_timeout or float(os.getenv('BACKEND_READ_TIMEOUT', 10)),
+        )
+
+        # Read and status retries only apply to idempotent methods; connect
+        # errors are retried for any method since nothing reached the backend.
+        retry = RefusalAwareRetry(
+            total=retries,
+            backoff_factor=0.1,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({'GET', 'HEAD'}),
+            raise_on_status=False,
+            respect_retry_after_header=False,
+        )
+        adapter = WSGIAdapter(app) if app is not None else HTTPAdapter(
+            pool_connections=4, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def slots(self, route):
+        with self.lock:
+            if route not in self.route_slots:
+                self.route_slots[route] = threading.BoundedSemaphore(self.route_limit)
+            return self.route_slots[route]
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        route = self.route_key() if self.route_key else None
+        slots = self.slots(route)
+        if not slots.acquire(timeout=self.admission_timeout):
+            raise BackendSaturated(f'Too many backend calls in flight for {route}')
+        try:
+            self.breaker.before_call()
+        except CircuitOpen:
+            slots.release()
+            raise
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self.session.request(method, url, **kwargs)
+            return response
+        finally:
+            slots.release()
+            self.breaker.record(not backend_failed(response))
+            if self.observer:
+                self.observer(method, url, response, time.perf_counter() - started)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
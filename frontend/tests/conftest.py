@@ -1,4 +1,7 @@
+import threading
+
 import pytest
+from werkzeug.serving import make_server
 import frontend.app as app_module
 from frontend.app import app
 
@@ -9,8 +12,42 @@ def client():
     # Patch backend URL in the module
     original_url = app_module.BACKEND_URL
     app_module.BACKEND_URL = 'http://mock-backend'
+    app_module.cache.clear()
+    app_module.fragment_cache.clear()
+    app_module.backend.breaker.reset()
     
     with app.test_client() as client:
         yield client
         
     app_module.BACKEND_URL = original_url
+
+@pytest.fixture(params=['http', 'inprocess'])
+def live_client(request, client, monkeypatch):
+    """Client whose backend calls reach the real backend app on a fresh database.
+
+    Parametrized over both transports: loopback HTTP to a threaded server, and
+    the in-process WSGI adapter used by co-located deployments.
+    """
+    backend_app = app_module.load_backend_app()
+    from backend.app import db, graph, prepared
+    graph.clear()
+    prepared.set()
+    with backend_app.app_context():
+        db.create_all()
+    server = None
+    if request.param == 'http':
+        server = make_server('127.0.0.1', 0, backend_app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        monkeypatch.setattr(app_module, 'BACKEND_URL', f'http://127.0.0.1:{server.server_port}')
+        transport = app_module.BackendClient(observer=app_module.record_backend_call,
+                                             route_key=app_module.current_route)
+    else:
+        transport = app_module.BackendClient(observer=app_module.record_backend_call, app=backend_app,
+                                             route_key=app_module.current_route)
+    monkeypatch.setattr(app_module, 'backend', transport)
+    yield client
+    if server is not None:
+        server.shutdown()
+    with backend_app.app_context():
+        db.session.remove()
+        db.drop_all()
@@ -1,6 +1,7 @@
 import pytest
 import requests_mock
 from flask import session
+from frontend.backend_client import WSGIAdapter
 
 def test_dashboard_access_protected(client):
     """Verify unauthorized access to dashboard renders landing page or specific content."""
@@ -15,17 +16,19 @@ def test_auth_flow_mock(client):
         sess['user_id'] = 1
     
     with requests_mock.Mocker() as m:
-        # Mock backend user fetch
-        m.get('http://mock-backend/api/users/1', json={
-            'id': 1, 'name': 'Test User', 'avatar_url': None
+        # Mock backend dashboard fetch (profile, friends and first history page)
+        m.get('http://mock-backend/api/users/1/dashboard', json={
+            'user': {'id': 1, 'name': 'Test User', 'avatar_url': None},
+            'friends': [],
+            'history': [],
+            'next_cursor': None
         })
-        m.get('http://mock-backend/api/users/1/friends', json=[])
-        m.get('http://mock-backend/api/users/1/history', json=[])
         
         resp = client.get('/')
         assert resp.status_code == 200
         assert b"Test User" in resp.data
         assert b"Sign Out" in resp.data
+        assert m.call_count == 1
 
 def test_htmx_share_url(client):
     """Test POST request to share URL returns HTML fragment."""
@@ -34,9 +37,12 @@ def test_htmx_share_url(client):
         
     with requests_mock.Mocker() as m:
         # Mock backend share API
-        m.post('http://mock-backend/api/shares', status_code=201)
-        # Mock backend user fetch for friend name (used in response construction)
-        m.get('http://mock-backend/api/users/2', json={'name': 'Friend User'})
+        # Mock backend share API; it resolves the receivers' names itself
+        m.post('http://mock-backend/api/shares', status_code=201, json={
+            'status': 'ok',
+            'shares': [{'id': 1, 'url': 'http://cool-link.com', 'receiver_id': 2, 'receiver_name': 'Friend User'}],
+            'rejected': []
+        })
         
         resp = client.post('/api/share', data={
             'url': 'http://cool-link.com',
@@ -48,6 +54,7 @@ def test_htmx_share_url(client):
         assert b'<div class="flex flex-col' in resp.data
         assert b'http://cool-link.com' in resp.data
         assert b'Friend User' in resp.data
+        assert m.call_count == 1
 
 def test_invite_friend_logic_frontend(client):
     """Test visiting invite link functionality (frontend side)."""
@@ -72,3 +79,399 @@ def test_invite_friend_logic_frontend(client):
         # Verify backend call was made
         assert m.called
         assert m.last_request.json() == {'user_id': 456, 'friend_id': 123}
+
+def test_history_partial_load_more(client):
+    """Test that a history page with a next cursor renders a load-more trigger."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/1/history', json=[{
+            'id': 7, 'url': 'http://old-link.com', 'timestamp': '2025-01-01T00:00:00',
+            'sender_id': 2, 'receiver_id': 1, 'sender_name': 'Friend', 'receiver_name': 'Me'
+        }], headers={'X-Next-Cursor': 'abc123'})
+
+        resp = client.get('/api/history_partial?cursor=xyz')
+
+        assert resp.status_code == 200
+        assert b'http://old-link.com' in resp.data
+        assert b'/api/history_partial?cursor=abc123' in resp.data
+        assert m.last_request.qs['cursor'] == ['xyz']
+
+def test_backend_calls_use_pooled_client(client):
+    """Test that gateway routes go through the shared session with timeouts set."""
+    import frontend.app as app_module
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/1/history', json=[])
+        client.get('/api/history_partial')
+
+        assert m.last_request.timeout == app_module.backend.timeout
+    adapter = app_module.backend.session.get_adapter('http://mock-backend')
+    if app_module.BACKEND_INPROCESS:
+        assert isinstance(adapter, WSGIAdapter)
+    else:
+        assert adapter.max_retries.allowed_methods == {'GET', 'HEAD'}
+
+def test_dashboard_caches_profile_and_friends(client):
+    """Test that profile and friends are cached and dropped when a friendship is created."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/1/dashboard', json={
+            'user': {'id': 1, 'name': 'Test User', 'avatar_url': None},
+            'friends': [{'id': 2, 'name': 'Old Friend', 'avatar_url': None}],
+            'history': [],
+            'next_cursor': None
+        })
+        client.get('/')
+        assert m.last_request.qs['fields'] == ['history,user,friends']
+
+        resp = client.get('/')
+        assert b'Old Friend' in resp.data
+        assert b'data-poll-seconds="30"' in resp.data
+        assert m.last_request.qs['fields'] == ['history']
+
+        m.post('http://mock-backend/api/friendships', status_code=201)
+        client.get('/invite/accept/3')
+        client.get('/')
+        assert m.last_request.qs['fields'] == ['history,friends']
+
+    from frontend.app import cache
+    assert cache.stats() == {'hits': 3, 'misses': 3}
+
+def test_auth_callback_sends_pending_invite_in_one_call(client):
+    """Test that first sign-in from an invite creates the friendship through the auth call."""
+    with client.session_transaction() as sess:
+        sess['pending_invite_sender'] = 7
+
+    with requests_mock.Mocker() as m:
+        m.post('http://mock-backend/api/users/auth', json={'id': 3, 'name': 'Mock Google User'})
+
+        resp = client.get('/auth/callback/google?mock=true')
+
+        assert resp.status_code == 302
+        assert m.call_count == 1
+        assert m.last_request.json()['invite_friend_id'] == 7
+
+def test_auth_callback_keeps_invite_on_failure_and_drops_stale_friend_lists(client):
+    """Test that a failed login keeps the pending invite and a renamed profile clears friends' cached lists."""
+    from frontend.app import cache, friends_key
+    cache.set(friends_key(5), [{'id': 3, 'name': 'Old Name', 'avatar_url': None}])
+    with client.session_transaction() as sess:
+        sess['pending_invite_sender'] = 7
+
+    with requests_mock.Mocker() as m:
+        m.post('http://mock-backend/api/users/auth', status_code=500)
+        assert client.get('/auth/callback/google?mock=true').status_code == 500
+        with client.session_transaction() as sess:
+            assert sess['pending_invite_sender'] == 7
+
+        m.post('http://mock-backend/api/users/auth', json={'id': 3, 'name': 'New Name', 'refreshed_friend_ids': [5]})
+        assert client.get('/auth/callback/google?mock=true').status_code == 302
+        assert m.last_request.json()['invite_friend_id'] == 7
+
+    with client.session_transaction() as sess:
+        assert 'pending_invite_sender' not in sess
+    assert cache.get(friends_key(5)) is None
+
+def test_history_partial_escapes_and_caches_fragments(client):
+    """Test that history items are autoescaped and rendered once per share."""
+    from frontend.app import fragment_cache
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/1/history', json=[{
+            'id': 9, 'url': 'http://x.com/"><script>alert(1)</script>', 'timestamp': '2025-01-01T00:00:00',
+            'sender_id': 1, 'receiver_id': 2, 'sender_name': 'Me', 'receiver_name': 'Friend'
+        }])
+
+        first = client.get('/api/history_partial').data
+        second = client.get('/api/history_partial').data
+
+    assert b'<script>' not in first
+    assert b'&lt;script&gt;' in first
+    assert first == second
+    assert fragment_cache.stats() == {'hits': 1, 'misses': 1}
+
+def test_history_fragments_follow_renamed_users(client):
+    """Test that a cached history item is re-rendered after the friend changes their name."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    item = {'id': 9, 'url': 'http://x.com', 'timestamp': '2025-01-01T00:00:00',
+            'sender_id': 2, 'receiver_id': 1, 'sender_name': 'Old Name', 'receiver_name': 'Me'}
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/1/history', json=[item])
+        assert b'Old Name' in client.get('/api/history_partial').data
+
+        m.get('http://mock-backend/api/users/1/history', json=[dict(item, sender_name='New Name')])
+        renamed = client.get('/api/history_partial').data
+
+    assert b'New Name' in renamed and b'Old Name' not in renamed
+
+def test_history_partial_passes_through_not_modified(client):
+    """Test that the gateway forwards If-None-Match and relays the backend's 304."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/1/history', status_code=304, headers={'ETag': '"1-4"'})
+
+        resp = client.get('/api/history_partial', headers={'If-None-Match': '"1-4"'})
+
+        assert resp.status_code == 304
+        assert resp.headers['ETag'] == '"1-4"'
+        assert m.last_request.headers['If-None-Match'] == '"1-4"'
+
+def test_events_relay_renders_share_fragments(client):
+    """Test that backend share events are relayed as rendered SSE fragments."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+
+    item = ('{"id": 5, "url": "http://pushed.example", "timestamp": "2025-01-01T00:00:00", "sender_id": 1, '
+            '"receiver_id": 2, "sender_name": "Friend", "receiver_name": "Me"}')
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/2/events', text=f'id: 41\n\n: keep-alive\n\nid: 42\ndata: {item}\n\n')
+
+        from frontend.app import sse_slots
+        free = sse_slots._value
+        resp = client.get('/events', headers={'Last-Event-ID': '41'})
+        body = resp.get_data(as_text=True)
+
+        # The slot is freed once the stream ends, even if the server never calls close()
+        assert sse_slots._value == free
+        resp.close()
+        assert sse_slots._value == free
+        assert resp.mimetype == 'text/event-stream'
+        assert m.last_request.headers['Last-Event-ID'] == '41'
+        assert body.startswith('retry: 1000\n\nid: 41\n\n: keep-alive\n\n')
+        assert 'id: 42\nevent: share\ndata: ' in body
+        assert 'http://pushed.example' in body and 'Friend &rarr; You' in body
+
+def test_server_timing_merges_backend_breakdown(client):
+    """Test that backend call time and the backend's own Server-Timing entries are relayed."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/1/history', json=[],
+              headers={'Server-Timing': 'db;dur=1.5;desc="2 queries", app;dur=0.7'})
+
+        resp = client.get('/api/history_partial')
+        resp.close()
+
+    timing = resp.headers.getlist('Server-Timing')
+    assert timing[0].startswith('backend;') and '"1 calls"' in timing[0]
+    assert 'backend-db;dur=1.5;desc="2 queries"' in timing
+    assert 'backend-app;dur=0.7' in timing
+    assert 'frontend_backend_call_seconds_count{method="GET",status="200"}' in client.get('/metrics').get_data(as_text=True)
+
+def test_history_search_pages_with_query(client):
+    """Test that search results render as history items with a query-preserving load-more link."""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/1/history/search', json=[{
+            'id': 4, 'url': 'http://python.example/tips', 'timestamp': '2025-01-01T00:00:00',
+            'sender_id': 2, 'receiver_id': 1, 'sender_name': 'Friend', 'receiver_name': 'Me'
+        }], headers={'X-Next-Cursor': '20'})
+
+        resp = client.get('/api/history_search?q=pyth tips')
+        body = resp.get_data(as_text=True)
+
+        assert m.last_request.qs['q'] == ['pyth tips']
+        assert 'http://python.example/tips' in body
+        assert '/api/history_search?q=pyth+tips&amp;cursor=20' in body
+
+        m.get('http://mock-backend/api/users/1/history/search', json=[])
+        assert 'No shared links match' in client.get('/api/history_search?q=nothing').get_data(as_text=True)
+
+def seed_friend(live_client, name='Friend'):
+    """Adds a user to the live backend and queues an invite from them for the next sign-in."""
+    from backend.app import app as backend_app, db, User
+    with backend_app.app_context():
+        friend = User(provider='test', provider_id=name.lower(), name=name)
+        db.session.add(friend)
+        db.session.commit()
+        friend_id = friend.id
+    with live_client.session_transaction() as sess:
+        sess['pending_invite_sender'] = friend_id
+    return friend_id
+
+def test_backend_round_trip(live_client):
+    """Test sign-in, sharing, history, search and export against the real backend, without mocks."""
+    friend_id = seed_friend(live_client)
+
+    assert live_client.get('/auth/callback/google?mock=true').status_code == 302
+    resp = live_client.post('/api/share', data={'url': 'http://live.example', 'friends': [str(friend_id)]})
+    assert resp.status_code == 200 and b'Friend' in resp.data
+
+    resp = live_client.get('/api/history_partial')
+    body = resp.get_data(as_text=True)
+    resp.close()
+    assert 'http://live.example' in body
+    assert any(entry.startswith('backend-db;') for entry in resp.headers.getlist('Server-Timing'))
+
+    resp = live_client.get('/api/history_search?q=live')
+    assert 'http://live.example' in resp.get_data(as_text=True)
+    resp.close()
+
+    export = live_client.get('/export?format=csv').get_data(as_text=True).splitlines()
+    assert len(export) == 2 and 'http://live.example' in export[1]
+
+def test_events_relay_from_backend(live_client, monkeypatch):
+    """Test that the backend's share events reach the browser as fragments and both ends free their slots."""
+    import backend.app as backend_module
+    from frontend.app import sse_slots
+    monkeypatch.setattr(backend_module, 'SSE_STREAM_SECONDS', 0.3)
+    monkeypatch.setattr(backend_module, 'SSE_HEARTBEAT', 0.1)
+    friend_id = seed_friend(live_client)
+    live_client.get('/auth/callback/google?mock=true')
+    live_client.post('/api/share', data={'url': 'http://pushed.example', 'friends': [str(friend_id)]})
+    with live_client.session_transaction() as sess:
+        sess['user_id'] = friend_id
+
+    free = sse_slots._value
+    resp = live_client.get('/events', headers={'Last-Event-ID': '0'})
+    body = resp.get_data(as_text=True)
+
+    assert resp.mimetype == 'text/event-stream'
+    assert body.startswith('retry: 1000\n\n')
+    assert '\nevent: share\ndata: ' in body and 'http://pushed.example' in body
+    assert sse_slots._value == free
+    assert len(backend_module.broker) == 0
+    resp.close()
+
+def test_export_relays_compressed_stream(client):
+    """Test that the export download is relayed without decompressing or buffering it."""
+    import gzip
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    body = gzip.compress(b'{"id": 1}\n{"id": 2}\n')
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/1/history/export', content=body, headers={
+            'Content-Type': 'application/x-ndjson', 'Content-Encoding': 'gzip',
+            'Content-Disposition': 'attachment; filename="history-1.ndjson"',
+        })
+
+        resp = client.get('/export?format=ndjson&since=2025-01-01', headers={'Accept-Encoding': 'gzip'})
+
+        assert m.last_request.qs == {'format': ['ndjson'], 'since': ['2025-01-01']}
+        assert m.last_request.headers['Accept-Encoding'] == 'gzip'
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert resp.headers['Content-Disposition'] == 'attachment; filename="history-1.ndjson"'
+        assert resp.data == body
+
+def test_circuit_breaker_fails_fast_after_backend_errors(client, monkeypatch):
+    """Test that consecutive backend failures open the circuit and later calls are shed with 503."""
+    import requests
+    from frontend.backend_client import CircuitBreaker
+    import frontend.app as app_module
+    monkeypatch.setattr(app_module.backend, 'breaker', CircuitBreaker(threshold=2, reset_timeout=30))
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/1/history', exc=requests.exceptions.ConnectTimeout)
+        assert client.get('/api/history_partial').status_code == 503
+        assert client.get('/api/history_partial').status_code == 503
+        assert app_module.backend.breaker.state == 'open'
+
+        resp = client.get('/api/history_partial')
+
+        assert resp.status_code == 503
+        assert 0 < int(resp.headers['Retry-After']) <= 30
+        assert m.call_count == 2
+
+def test_backend_errors_surface_and_open_the_circuit(client, monkeypatch):
+    """Test that backend 500s are reported as unavailable, not an empty history, and open the circuit."""
+    from frontend.backend_client import CircuitBreaker
+    import frontend.app as app_module
+    monkeypatch.setattr(app_module.backend, 'breaker', CircuitBreaker(threshold=2, reset_timeout=30))
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/1/history', status_code=500, json={'error': 'database is locked'})
+        for _ in range(3):
+            resp = client.get('/api/history_partial')
+            assert resp.status_code == 503 and b'No history yet' not in resp.data
+        assert app_module.backend.breaker.state == 'open'
+        assert m.call_count == 2
+
+def test_capacity_refusals_are_not_retried_or_counted(client, monkeypatch):
+    """Test that backend 503s with Retry-After neither retry nor open the circuit."""
+    from frontend.backend_client import BackendClient, CircuitBreaker
+    import frontend.app as app_module
+    monkeypatch.setattr(app_module.backend, 'breaker', CircuitBreaker(threshold=2, reset_timeout=30))
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/1/events', status_code=503, headers={'Retry-After': '5'},
+              json={'error': 'Too many subscribers'})
+        for _ in range(3):
+            assert client.get('/events').status_code == 503
+        assert app_module.backend.breaker.state == 'closed'
+
+    retry = BackendClient().session.get_adapter('http://backend').max_retries
+    assert not retry.is_retry('GET', 503, has_retry_after=True)
+    assert retry.is_retry('GET', 503)
+
+def test_route_concurrency_limit_sheds_load(client, monkeypatch):
+    """Test that a route with all its backend slots busy answers 503 without calling the backend."""
+    import frontend.app as app_module
+    monkeypatch.setattr(app_module.backend, 'admission_timeout', 0)
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    slots = app_module.backend.slots('history_partial')
+    held = [slots.acquire(blocking=False) for _ in range(app_module.backend.route_limit)]
+    try:
+        with requests_mock.Mocker() as m:
+            resp = client.get('/api/history_partial')
+            assert resp.status_code == 503 and resp.headers['Retry-After'] == '1'
+            assert m.call_count == 0
+    finally:
+        for _ in held:
+            slots.release()
+
+def test_dashboard_degrades_to_cached_profile(client):
+    """Test that the dashboard still renders the cached profile when the backend is down."""
+    import frontend.app as app_module
+    app_module.cache.set(app_module.user_key(1), {'id': 1, 'name': 'Cached User', 'avatar_url': None})
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with requests_mock.Mocker() as m:
+        m.get('http://mock-backend/api/users/1/dashboard', status_code=503)
+        resp = client.get('/')
+
+    assert resp.status_code == 200
+    assert b'Cached User' in resp.data
+    assert b'History is temporarily unavailable' in resp.data
+
+def test_oauth_client_is_created_on_first_login(client, monkeypatch):
+    """authlib is not imported with the app; the provider client is registered on the first real login."""
+    import frontend.app as app_module
+    monkeypatch.setattr(app_module, 'oauth', None)
+    monkeypatch.setattr(app_module, 'GOOGLE_CLIENT_ID', 'client-id')
+    monkeypatch.setitem(app_module.OAUTH_PROVIDERS, 'google', {
+        'client_id': 'client-id', 'client_secret': 'secret',
+        'authorize_url': 'https://accounts.example/authorize', 'access_token_url': 'https://accounts.example/token',
+    })
+
+    resp = client.get('/auth/login/google')
+    assert resp.status_code == 302
+    assert resp.location.startswith('https://accounts.example/authorize?')
+    assert 'client_id=client-id' in resp.location
+    assert app_module.oauth is not None
@@ -3,49 +3,199 @@ import time
 import os
 import signal
 import sys
+import urllib.request
+import urllib.error
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Development runs one auto-reloading worker per service; production runs a
+# pool of workers per service, restarts crashed services and drains on SIGTERM.
+PRODUCTION = os.getenv('RUN_MODE') == 'production' or '--production' in sys.argv
+# The frontend calls the backend app in-process, so no backend server is started
+INPROCESS = os.getenv('BACKEND_INPROCESS') == '1'
+# The workspace environment synced (and bytecode-compiled) at image build time. Production
+# starts services straight from it: `uv run` would re-resolve and re-check it on every start.
+VENV_BIN = os.path.join(ROOT, ".venv", "bin")
+DIRECT = PRODUCTION and os.path.exists(os.path.join(VENV_BIN, "uvicorn"))
+
+BACKEND_PORT = 8081
+FRONTEND_PORT = 8080
+READINESS_TIMEOUT = float(os.getenv('READINESS_TIMEOUT', 30))
+# Seconds uvicorn waits for in-flight requests after SIGTERM (Cloud Run allows 10 in total)
+GRACEFUL_TIMEOUT = int(os.getenv('GRACEFUL_TIMEOUT', 8))
+MAX_RESTART_BACKOFF = 30
+# A service that stayed up this long is considered healthy again
+STABLE_AFTER = 60
+
+
+def in_memory_database(env):
+    url = env.get('DATABASE_URL', 'sqlite:///:memory:')
+    return url.startswith('sqlite') and (':memory:' in url or url.rstrip('/') == 'sqlite:')
+
+
+def worker_count(name, env):
+    # One process per service by default: the frontend's caches and the backend's
+    # event broker live in process memory, so workers would not see each other's
+    # invalidations or published shares.
+    count = max(1, int(env.get(f'{name}_WORKERS') or env.get('WEB_CONCURRENCY') or 1))
+    if name == ('FRONTEND' if INPROCESS else 'BACKEND') and count > 1 and in_memory_database(env):
+        # Each worker would get its own private database
+        print(f"[WARN] DATABASE_URL is in-memory; running a single {name.lower()} worker.")
+        return 1
+    if count > 1:
+        print(f"[WARN] {count} {name.lower()} workers keep separate caches and event brokers; "
+              "friend lists may be stale for up to CACHE_TTL and live updates reach only "
+              "streams on the publishing worker.")
+    return count
+
+
+def tool_cmd(name, *args):
+    if DIRECT:
+        return [os.path.join(VENV_BIN, name), *args]
+    return ["uv", "run", name, *args]
+
+
+def uvicorn_cmd(port, workers):
+    cmd = tool_cmd("uvicorn", "app:app", "--host", "0.0.0.0", "--port", str(port), "--interface", "wsgi")
+    if PRODUCTION:
+        cmd += ["--workers", str(workers), "--timeout-graceful-shutdown", str(GRACEFUL_TIMEOUT)]
+    else:
+        cmd += ["--reload"]
+    return cmd
+
+
+class Service:
+    """One uvicorn process (and its workers), restarted with exponential backoff when it dies."""
+
+    def __init__(self, name, cmd, cwd, env):
+        self.name = name
+        self.cmd = cmd
+        self.cwd = cwd
+        self.env = env
+        self.proc = None
+        self.started_at = 0
+        self.failures = 0
+        self.restart_at = None
+
+    def start(self):
+        print(f"[INFO] Starting {self.name}: {' '.join(self.cmd)}")
+        # Own process group, so workers orphaned by a crashed master can be reaped with it
+        self.proc = subprocess.Popen(self.cmd, env=self.env, cwd=self.cwd, start_new_session=True)
+        self.started_at = time.monotonic()
+        self.restart_at = None
+
+    def supervise(self):
+        if self.proc.poll() is None:
+            return
+        now = time.monotonic()
+        if self.restart_at is None:
+            if now - self.started_at > STABLE_AFTER:
+                self.failures = 0
+            delay = min(MAX_RESTART_BACKOFF, 2 ** self.failures)
+            self.failures += 1
+            self.restart_at = now + delay
+            print(f"[WARN] {self.name} exited with code {self.proc.returncode}; restarting in {delay}s.")
+            self.kill_group()
+        elif now >= self.restart_at:
+            self.start()
+
+    def kill_group(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def stop(self):
+        if self.proc is None:
+            return
+        if self.proc.poll() is None:
+            # uvicorn stops accepting connections and drains in-flight requests
+            self.proc.send_signal(signal.SIGTERM)
+            try:
+                self.proc.wait(timeout=GRACEFUL_TIMEOUT + 2)
+            except subprocess.TimeoutExpired:
+                print(f"[WARN] {self.name} did not stop in time; killing it.")
+        self.kill_group()
+        self.proc.wait()
+
+
+def wait_ready(url, service, timeout):
+    """Polls a health endpoint until it answers 200, the service dies or the timeout passes."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if service.proc.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(url, timeout=2) as resp:
+                if resp.status == 200:
+                    return True
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.05)
+    return False
+
+
+def upgrade_database(env):
+    """Applies schema migrations once, before any worker imports the app."""
+    if in_memory_database(env):
+        return True
+    print("[INFO] Applying database migrations...")
+    result = subprocess.run(tool_cmd("flask", "--app", "app", "db-upgrade"), env=env,
+                            cwd=os.path.join(ROOT, "backend"))
+    return result.returncode == 0
+
 
 def run_servers():
     env = os.environ.copy()
-    
-    # Processes
-    procs = []
-    
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    if PRODUCTION:
+        if not upgrade_database(env):
+            print("[ERROR] Database migrations failed.")
+            return 1
+        env['DB_AUTO_UPGRADE'] = '0'
+
+    # Run each service from its own directory so uv finds its pyproject.toml
+    backend = Service("Backend", uvicorn_cmd(BACKEND_PORT, worker_count('BACKEND', env)),
+                      os.path.join(ROOT, "backend"), env)
+    frontend = Service("Frontend", uvicorn_cmd(FRONTEND_PORT, worker_count('FRONTEND', env)),
+                       os.path.join(ROOT, "frontend"), env)
+
+    services = [frontend] if INPROCESS else [backend, frontend]
+
     try:
-        # Run backend: Change dir to backend so uv finds backend/pyproject.toml
-        # Using uvicorn with WSGI interface and reload enabled
-        backend_cmd = ["uv", "run", "uvicorn", "app:app", "--host", "0.0.0.0", "--port", "8081", "--reload", "--interface", "wsgi"]
-        backend_proc = subprocess.Popen(backend_cmd, env=env, cwd=os.path.join(os.getcwd(), "backend"))
-        procs.append(backend_proc)
-        
-        # Give backend a moment to initialize
-        time.sleep(2)
-
-        print("[INFO] Starting Frontend Server (Port 8080)...")
-        # Run frontend: Change dir to frontend so uv finds frontend/pyproject.toml
-        frontend_cmd = ["uv", "run", "uvicorn", "app:app", "--host", "0.0.0.0", "--port", "8080", "--reload", "--interface", "wsgi"]
-        frontend_proc = subprocess.Popen(frontend_cmd, env=env, cwd=os.path.join(os.getcwd(), "frontend"))
-        procs.append(frontend_proc)
-        
+        if not INPROCESS:
+            backend.start()
+            if not wait_ready(f"http://127.0.0.1:{BACKEND_PORT}/health", backend, READINESS_TIMEOUT):
+                print("[ERROR] Backend did not become ready.")
+                return 1
+            print("[INFO] Backend is ready.")
+
+        print(f"[INFO] Starting Frontend Server (Port {FRONTEND_PORT})...")
+        frontend.start()
+
         print("\n[SUCCESS] Environment is running!")
         print("Press Ctrl+C to stop.\n")
-        
+
         # Monitor Loop
-        while True:
+        while not stopping:
             time.sleep(1)
-            if backend_proc.poll() is not None:
-                print("[WARN] Backend process exited unexpectedly.")
-                break
-            if frontend_proc.poll() is not None:
-                print("[WARN] Frontend process exited unexpectedly.")
-                break
-
-    except KeyboardInterrupt:
-        print("\n[INFO] Stopping servers...")
+            for service in services:
+                service.supervise()
     finally:
-        for p in procs:
-            if p.poll() is None:
-                p.terminate()
+        print("\n[INFO] Stopping servers...")
+        # Frontend first: its in-flight requests still need the backend
+        frontend.stop()
+        backend.stop()
         print("[INFO] Shutdown complete.")
+    return 0
 
 if __name__ == "__main__":
-    run_servers()
+    sys.exit(run_servers())